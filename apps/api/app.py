@@ -10,6 +10,7 @@ from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity
 from flask_marshmallow import Marshmallow
 from flask_sqlalchemy import SQLAlchemy
 from marshmallow import Schema, ValidationError, fields
+from werkzeug.exceptions import HTTPException
 
 # Import enhanced modules
 from config import get_config, validate_config
@@ -60,6 +61,10 @@ def handle_global_exception(error):
     """Global exception handler that logs stacktrace but returns sanitized response"""
     import traceback
     
+    # HTTP errors such as 413 already carry the right status; don't turn them into a 500
+    if isinstance(error, HTTPException):
+        return error
+    
     # Log the full stacktrace for debugging
     app.logger.error(f"Unhandled exception: {str(error)}")
     app.logger.error(f"Stacktrace: {traceback.format_exc()}")
@@ -134,7 +139,7 @@ class User(db.Model):
     def set_password(self, password):
         """Hash and set password"""
         password_bytes = password.encode("utf-8")
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=app.config.get("BCRYPT_LOG_ROUNDS", 12))
         self.password_hash = bcrypt.hashpw(password_bytes, salt).decode("utf-8")
 
     def check_password(self, password):
@@ -7,6 +7,7 @@ import os
 from datetime import timedelta
 from typing import Dict, Any
 from dotenv import load_dotenv
+from sqlalchemy.pool import StaticPool
 
 
 class BaseConfig:
@@ -49,6 +50,9 @@ class BaseConfig:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_ALGORITHM = 'HS256'
     
+    # Password Hashing Configuration
+    BCRYPT_LOG_ROUNDS = 12
+    
     # AI Configuration
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     GEMINI_MODEL = 'gemini-1.5-flash'
@@ -109,8 +113,16 @@ class TestingConfig(BaseConfig):
     TESTING = True
     DEBUG = True
     
-    # Use in-memory database for testing
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # Use in-memory database for testing; point TEST_DATABASE_URL at Postgres
+    # to run the postgres-marked tests
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite:///:memory:')
+    
+    # One shared connection so the request thread and the test see the same
+    # in-memory database (pool_size doesn't apply to StaticPool)
+    SQLALCHEMY_ENGINE_OPTIONS = (
+        {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+        if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else BaseConfig.SQLALCHEMY_ENGINE_OPTIONS
+    )
     
     # Shorter token expiry for testing
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=10)
@@ -122,8 +134,12 @@ class TestingConfig(BaseConfig):
     SECRET_KEY = 'testing-secret-key'
     JWT_SECRET_KEY = 'testing-jwt-secret'
     
-    # Disable rate limiting for testing
-    RATELIMIT_ENABLED = False
+    # Keep rate limiting on - the security suite asserts 429s and conftest
+    # resets the in-memory counters between tests
+    RATELIMIT_ENABLED = True
+    
+    # Minimum bcrypt cost - tests don't need brute-force resistance
+    BCRYPT_LOG_ROUNDS = 4
     
     @staticmethod
     def init_app(app):
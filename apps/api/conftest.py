@@ -2,35 +2,192 @@
 Pytest configuration and fixtures for the Diet Planner backend.
 """
 import os
+import sys
 import tempfile
+import functools
+import types
+import bcrypt
 import pytest
 from datetime import datetime, timedelta
-from app import app, db, User, DietPlan, MealLog
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+
+class _StubGenerativeModel:
+    """Offline stand-in for ``genai.GenerativeModel``; tests patch ``generate_content``."""
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, *args, **kwargs):
+        raise RuntimeError("google.generativeai is stubbed out in tests")
+
+
+# Stub the Gemini SDK before the app imports it - the real package drags in
+# grpc and protobuf, which is most of the collection time
+_genai_stub = types.ModuleType('google.generativeai')
+_genai_stub.GenerativeModel = _StubGenerativeModel
+_genai_stub.configure = MagicMock()
+sys.modules.setdefault('google.generativeai', _genai_stub)
+
+# TestingConfig runs against in-memory SQLite unless TEST_DATABASE_URL is set
+os.environ.setdefault('APP_ENV', 'testing')
+
+from app import app, db, security_manager, User, DietPlan, MealLog
+from flask_jwt_extended import JWTManager, create_access_token
+from flask_jwt_extended.config import _Config as JWTConfig
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.orm import close_all_sessions
+from freezegun import freeze_time
+from limits.storage import MemoryStorage
 import factory
+import factory.random
+
+
+class _ConnectionBoundSession(Session):
+    """Session that always uses the connection it was bound to.
+
+    Flask-SQLAlchemy picks an engine per bind key and ignores ``bind=``, which
+    would let test writes escape the per-test transaction.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+def _enable_sqlite_savepoints(engine):
+    """Let SQLAlchemy issue BEGIN itself so db_session's SAVEPOINTs roll back on pysqlite."""
+    @event.listens_for(engine, 'connect')
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _emit_begin(connection):
+        connection.exec_driver_sql('BEGIN')
 
 
-@pytest.fixture(scope='function')
+@pytest.fixture(scope='session')
 def test_app():
-    """Create and configure a test app instance."""
+    """Create and configure the test app once for the whole session."""
     # Just use the existing app but create separate test tables
     app.config['TESTING'] = True
     app.config['JWT_SECRET_KEY'] = 'test-jwt-secret'
     app.config['SECRET_KEY'] = 'test-secret-key'
     app.config['WTF_CSRF_ENABLED'] = False
+    app.config['BCRYPT_LOG_ROUNDS'] = 4
     
     with app.app_context():
-        # Create tables if they don't exist (PostgreSQL will be used)
+        if db.engine.dialect.name == 'sqlite':
+            _enable_sqlite_savepoints(db.engine)
+        # Create tables if they don't exist (in-memory SQLite unless TEST_DATABASE_URL is set)
         db.create_all()
         yield app
-        # Don't drop tables - just clean data in teardown
+        # Don't drop tables - each test rolls back its own transaction
 
 
-@pytest.fixture
+@pytest.fixture(scope='session', autouse=True)
+def _frozen_clock():
+    """Pin the clock so token exp claims, and therefore token bytes, match across tests."""
+    with freeze_time('2025-01-01 00:00:00'):
+        yield
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _memoized_jwt_decode(_frozen_clock):
+    """With the clock frozen a token's validity never changes, so verify each token once."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(JWTManager, '_decode_jwt_from_config',
+                   functools.lru_cache(maxsize=8)(JWTManager._decode_jwt_from_config))
+        yield
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _cached_jwt_config(test_app):
+    """Resolve the JWT signing key and algorithm once rather than on every encode/decode."""
+    with pytest.MonkeyPatch.context() as mp:
+        for name in ('encode_key', 'decode_key', 'algorithm'):
+            getter = functools.lru_cache(maxsize=1)(getattr(JWTConfig, name).fget)
+            mp.setattr(JWTConfig, name, property(getter))
+        yield
+
+
+@pytest.fixture(autouse=True)
+def _require_postgres(request, test_app):
+    """Skip postgres-marked tests unless the suite is running against Postgres."""
+    if request.node.get_closest_marker('postgres') and db.engine.dialect.name != 'postgresql':
+        pytest.skip('needs Postgres - set TEST_DATABASE_URL')
+
+
+@pytest.fixture(scope='module')
 def client(test_app):
-    """Create a test client."""
+    """Create a test client shared by every test in the module."""
+    return test_app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def _plaintext_bcrypt(request, monkeypatch):
+    """Replace bcrypt with a plain-text stand-in unless the test is marked no_bcrypt_mock."""
+    if request.node.get_closest_marker('no_bcrypt_mock'):
+        return
+    monkeypatch.setattr(bcrypt, 'hashpw', lambda password, salt: b'plain:' + password)
+    monkeypatch.setattr(bcrypt, 'checkpw', _plaintext_checkpw)
+
+
+def _plaintext_checkpw(password, hashed):
+    """checkpw stand-in; real hashes (HASHED_PW) still go through bcrypt."""
+    if hashed.startswith(b'plain:'):
+        return hashed == b'plain:' + password
+    return _real_checkpw(password, hashed)
+
+
+@pytest.fixture(scope='module')
+def secure_client(test_app):
+    """Test client for tests that assert on Talisman's security headers."""
     return test_app.test_client()
 
 
+@pytest.fixture(autouse=True)
+def _skip_talisman(request, test_app, monkeypatch):
+    """Drop Talisman's per-request hooks for unit tests that don't use secure_client."""
+    if not request.node.get_closest_marker('unit') or 'secure_client' in request.fixturenames:
+        return
+    talisman = security_manager.talisman
+    hooks = (talisman._force_https, talisman._make_nonce, talisman._set_response_headers)
+    for funcs in (test_app.before_request_funcs, test_app.after_request_funcs):
+        monkeypatch.setitem(funcs, None, [f for f in funcs[None] if f not in hooks])
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _frozen_rate_limit_expiry(_frozen_clock):
+    """Stop the in-memory limiter's background sweep from expiring counters.
+
+    freezegun leaves threads on the real clock, so the sweep sees every window
+    stamped at the frozen time as long past and drops it mid-test. Counters are
+    reset before each test anyway.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(MemoryStorage, '_MemoryStorage__expire_events', lambda self: None)
+        yield
+
+
+@pytest.fixture(autouse=True)
+def _reset_rate_limits(test_app):
+    """Give every test fresh rate-limit counters despite the shared app."""
+    security_manager.limiter.reset()
+    security_manager.failed_login_attempts.clear()
+    security_manager.blocked_ips.clear()
+
+
+@pytest.fixture
+def fresh_app(test_app):
+    """Opt-in fixture for tests that mutate app config; restores it afterwards."""
+    saved_config = dict(test_app.config)
+    yield test_app
+    test_app.config.clear()
+    test_app.config.update(saved_config)
+
+
 @pytest.fixture
 def app_context(test_app):
     """Create an application context."""
@@ -40,24 +197,40 @@ def app_context(test_app):
 
 @pytest.fixture
 def db_session(app_context):
-    """Create a database session for testing."""
-    # Clean up any existing test data
-    db.session.query(DietPlan).delete()
-    db.session.query(MealLog).delete()
-    db.session.query(User).delete()
-    db.session.commit()
+    """Create a database session for testing.
+
+    The session is joined to an outer transaction on a dedicated connection;
+    ``commit()`` calls made by tests or views only release a SAVEPOINT, and the
+    outer transaction is rolled back on teardown so no data outlives the test.
+    """
+    connection = db.engine.connect()
+    transaction = connection.begin()
+
+    original_session = db.session
+    db.session = db._make_scoped_session({
+        'class_': _ConnectionBoundSession,
+        'bind': connection,
+        'join_transaction_mode': 'create_savepoint',
+    })
     
     yield db.session
     
-    # Clean up after test
-    db.session.rollback()
-    db.session.query(DietPlan).delete()
-    db.session.query(MealLog).delete()
-    db.session.query(User).delete()
-    db.session.commit()
+    # Discard everything the test wrote
+    db.session.remove()
+    transaction.rollback()
+    connection.close()
+    db.session = original_session
 
 
 # Factories for test data generation
+# Hash the factory password once at the minimum cost instead of once per user
+HASHED_PW = bcrypt.hashpw(b'password123', bcrypt.gensalt(rounds=4)).decode('utf-8')
+_real_checkpw = bcrypt.checkpw
+
+# Deterministic fake data across runs and xdist workers
+factory.random.reseed_random(0)
+
+
 class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
     """Factory for creating test users."""
     
@@ -66,7 +239,7 @@ class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
         sqlalchemy_session_persistence = 'commit'
     
     name = factory.Faker('name')
-    email = factory.Faker('email')
+    email = factory.Sequence(lambda n: f'user{n}@example.com')
     age = factory.Faker('random_int', min=18, max=80)
     gender = factory.Faker('random_element', elements=['male', 'female', 'other'])
     weight = factory.Faker('random_int', min=40, max=150)
@@ -76,15 +249,7 @@ class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
     diet_preference = factory.Faker('random_element',
                                    elements=['balanced', 'vegetarian', 'vegan', 'keto', 'paleo'])
     health_goals = factory.Faker('text', max_nb_chars=200)
-    password_hash = factory.LazyFunction(lambda: _hash_password("password123"))
-
-
-def _hash_password(password):
-    """Helper function to hash password for factory."""
-    import bcrypt
-    password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+    password_hash = HASHED_PW
 
 
 class DietPlanFactory(factory.alchemy.SQLAlchemyModelFactory):
@@ -125,11 +290,16 @@ class DietPlanFactory(factory.alchemy.SQLAlchemyModelFactory):
     })
 
 
+# Fixed primary key for sample_user so a single signed token stays valid across tests;
+# every test rolls back, so the id is free again for the next one.
+SAMPLE_USER_ID = 424242
+
+
 @pytest.fixture
 def sample_user(db_session):
     """Create a sample user for testing."""
     UserFactory._meta.sqlalchemy_session = db_session
-    user = UserFactory()
+    user = UserFactory(id=SAMPLE_USER_ID)
     db_session.commit()
     return user
 
@@ -143,16 +313,52 @@ def sample_diet_plan(db_session, sample_user):
     return diet_plan
 
 
+@pytest.fixture(scope='session')
+def precomputed_token(test_app, _frozen_clock):
+    """Sign one access token for the sample user and reuse it for the whole session."""
+    with test_app.app_context():
+        return create_access_token(identity=SAMPLE_USER_ID, expires_delta=timedelta(hours=24))
+
+
 @pytest.fixture
-def auth_headers(client, sample_user):
+def auth_headers(sample_user, precomputed_token):
     """Get authentication headers for a user."""
-    login_data = {
-        'email': sample_user.email,
-        'password': 'password123'
-    }
-    response = client.post('/api/login', json=login_data)
-    token = response.get_json()['access_token']
-    return {'Authorization': f'Bearer {token}'}
+    return {'Authorization': f'Bearer {precomputed_token}'}
+
+
+@pytest.fixture(scope='class')
+def authed_user(client):
+    """Create one user and sign a token for it once for every test in the class.
+
+    The user is committed outside the per-test transaction so it survives
+    between tests, and is removed again when the class finishes. The token is
+    signed directly, like ``precomputed_token``, so the fixture doesn't depend
+    on /api/login passing CSRF and rate limiting.
+    """
+    # Requests share the session-wide app context, so a view may have left
+    # its session mid-transaction on the single SQLite connection
+    close_all_sessions()
+    with app.app_context():
+        user = UserFactory.build()
+        db.session.add(user)
+        db.session.commit()
+        db.session.refresh(user)
+        db.session.expunge(user)
+        token = create_access_token(identity=user.id)
+    
+    try:
+        yield SimpleNamespace(
+            user=user,
+            token=token,
+            headers={'Authorization': f'Bearer {token}'}
+        )
+    finally:
+        close_all_sessions()
+        with app.app_context():
+            db.session.query(DietPlan).filter_by(user_id=user.id).delete()
+            db.session.query(MealLog).filter_by(user_id=user.id).delete()
+            db.session.query(User).filter_by(id=user.id).delete()
+            db.session.commit()
 
 
 @pytest.fixture
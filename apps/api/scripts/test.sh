@@ -23,14 +23,18 @@ mypy app.py --ignore-missing-imports
 
 # Run unit tests
 echo "🔬 Running unit tests..."
-pytest tests/unit/ -v --cov=app --cov-report=html --cov-report=term-missing --cov-fail-under=80
+pytest tests/unit/ -m "not serial" -v --cov=app --cov-report=html --cov-report=term-missing --cov-fail-under=80
 
 # Run integration tests
 echo "🔧 Running integration tests..."
 pytest tests/integration/ -v
 
-# Run all tests with coverage
+# Run all tests with coverage (sharded across cores by pytest-xdist)
 echo "📊 Running all tests with coverage..."
-pytest tests/ -v --cov=app --cov-report=html --cov-report=term-missing
+pytest tests/ -m "not serial" -v --cov=app --cov-report=html --cov-report=term-missing
+
+# Re-run tests that mutate global module state in a single process
+echo "🧵 Running serial tests..."
+pytest tests/ -m serial -n 0 -v
 
 echo "✅ All backend tests passed!"
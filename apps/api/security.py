@@ -66,7 +66,7 @@ class SecurityManager:
         # Only enforce HTTPS in production
         force_https = os.getenv('APP_ENV') == 'production'
         
-        Talisman(
+        self.talisman = Talisman(
             app,
             force_https=force_https,
             strict_transport_security=True,
@@ -1,7 +1,6 @@
 """
 Integration tests for complete authentication flow.
 """
-import json
 from unittest.mock import patch
 
 import pytest
@@ -32,7 +31,7 @@ class TestCompleteAuthFlow:
         register_response = client.post("/api/register", json=user_data)
         assert register_response.status_code == 201
 
-        register_data = json.loads(register_response.data)
+        register_data = register_response.get_json()
         assert "access_token" in register_data
         assert "user" in register_data
 
@@ -44,7 +43,7 @@ class TestCompleteAuthFlow:
         profile_response = client.get("/api/profile", headers=auth_headers)
         assert profile_response.status_code == 200
 
-        profile_data = json.loads(profile_response.data)
+        profile_data = profile_response.get_json()
         assert profile_data["email"] == "integration@example.com"
         assert profile_data["name"] == "Integration Test User"
 
@@ -54,34 +53,23 @@ class TestCompleteAuthFlow:
         login_response = client.post("/api/login", json=login_data)
         assert login_response.status_code == 200
 
-        login_response_data = json.loads(login_response.data)
+        login_response_data = login_response.get_json()
         assert "access_token" in login_response_data
+        assert login_response_data["user"]["email"] == "integration@example.com"
 
         new_token = login_response_data["access_token"]
         new_auth_headers = {"Authorization": f"Bearer {new_token}"}
 
-        # Step 4: Access profile with new token
-        profile_response_2 = client.get("/api/profile", headers=new_auth_headers)
-        assert profile_response_2.status_code == 200
-
-        # Step 5: Update profile
+        # Step 4: Update profile with the new token (the response carries the saved user)
         update_data = {"name": "Updated Integration User", "age": 29, "weight": 66}
 
         update_response = client.put("/api/profile", json=update_data, headers=new_auth_headers)
         assert update_response.status_code == 200
 
-        update_response_data = json.loads(update_response.data)
+        update_response_data = update_response.get_json()
         assert update_response_data["user"]["name"] == "Updated Integration User"
         assert update_response_data["user"]["age"] == 29
 
-        # Step 6: Verify updated profile
-        final_profile_response = client.get("/api/profile", headers=new_auth_headers)
-        assert final_profile_response.status_code == 200
-
-        final_profile_data = json.loads(final_profile_response.data)
-        assert final_profile_data["name"] == "Updated Integration User"
-        assert final_profile_data["age"] == 29
-
     def test_invalid_token_rejection(self, client):
         """Test that invalid tokens are properly rejected."""
         invalid_headers = {"Authorization": "Bearer invalid_token_here"}
@@ -90,8 +78,8 @@ class TestCompleteAuthFlow:
         profile_response = client.get("/api/profile", headers=invalid_headers)
         assert profile_response.status_code == 422  # JWT decode error
 
-        # diet_plan_response = client.post("/api/diet-plan", headers=invalid_headers)  # Not used
-        assert profile_response.status_code == 422
+        diet_plan_response = client.post("/api/diet-plan", headers=invalid_headers)
+        assert diet_plan_response.status_code == 422
 
     def test_missing_token_rejection(self, client):
         """Test that requests without tokens are rejected."""
@@ -111,6 +99,7 @@ class TestCompleteAuthFlow:
 class TestPasswordUpdateFlow:
     """Test password update functionality."""
 
+    @pytest.mark.no_bcrypt_mock
     def test_password_update_and_login(self, client, db_session):
         """Test updating password and logging in with new password."""
         # Register user
@@ -127,7 +116,7 @@ class TestPasswordUpdateFlow:
         assert register_response.status_code == 201
 
         # Get token
-        token = json.loads(register_response.data)["access_token"]
+        token = register_response.get_json()["access_token"]
         auth_headers = {"Authorization": f"Bearer {token}"}
 
         # Update password
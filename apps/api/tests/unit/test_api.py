@@ -1,31 +1,27 @@
 """
 Unit tests for API endpoints.
 """
-import json
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from app import app
 
+pytestmark = [pytest.mark.unit, pytest.mark.api]
 
-@pytest.mark.unit
-@pytest.mark.api
-class TestHealthEndpoint:
-    """Test cases for health check endpoint."""
 
-    def test_health_check(self, client):
-        """Test health check endpoint returns correct response."""
-        response = client.get("/api/health")
+# Health check endpoint
 
-        assert response.status_code == 200
-        data = json.loads(response.data)
-        assert data["status"] == "healthy"
-        assert "Diet Planner API is running" in data["message"]
+def test_health_check(client):
+    """Test health check endpoint returns correct response."""
+    response = client.get("/api/health")
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["status"] == "healthy"
+    assert "Diet Planner API is running" in data["message"]
 
 
-@pytest.mark.unit
-@pytest.mark.api
 @pytest.mark.auth
 class TestAuthenticationEndpoints:
     """Test cases for authentication endpoints."""
@@ -48,7 +44,7 @@ class TestAuthenticationEndpoints:
         response = client.post("/api/register", json=user_data)
 
         assert response.status_code == 201
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "access_token" in data
         assert "user" in data
         assert data["user"]["email"] == "test@example.com"
@@ -68,7 +64,7 @@ class TestAuthenticationEndpoints:
         response = client.post("/api/register", json=invalid_data)
 
         assert response.status_code == 400
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "error" in data
 
     def test_register_duplicate_email(self, client, sample_user):
@@ -85,7 +81,7 @@ class TestAuthenticationEndpoints:
         response = client.post("/api/register", json=user_data)
 
         assert response.status_code == 409
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "already exists" in data["error"]
 
     def test_login_valid_credentials(self, client, sample_user):
@@ -98,7 +94,7 @@ class TestAuthenticationEndpoints:
         response = client.post("/api/login", json=login_data)
 
         assert response.status_code == 200
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "access_token" in data
         assert "user" in data
         assert data["message"] == "Login successful"
@@ -110,7 +106,7 @@ class TestAuthenticationEndpoints:
         response = client.post("/api/login", json=login_data)
 
         assert response.status_code == 401
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "Invalid email or password" in data["error"]
 
     def test_login_nonexistent_user(self, client):
@@ -120,7 +116,7 @@ class TestAuthenticationEndpoints:
         response = client.post("/api/login", json=login_data)
 
         assert response.status_code == 401
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "Invalid email or password" in data["error"]
 
     def test_login_missing_fields(self, client):
@@ -134,8 +130,6 @@ class TestAuthenticationEndpoints:
         assert response.status_code == 400
 
 
-@pytest.mark.unit
-@pytest.mark.api
 @pytest.mark.auth
 class TestProfileEndpoints:
     """Test cases for profile management endpoints."""
@@ -145,7 +139,7 @@ class TestProfileEndpoints:
         response = client.get("/api/profile", headers=auth_headers)
 
         assert response.status_code == 200
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "email" in data
         assert "name" in data
 
@@ -163,7 +157,7 @@ class TestProfileEndpoints:
 
 
         assert response.status_code == 200
-        data = json.loads(response.data)
+        data = response.get_json()
         assert data["message"] == "Profile updated successfully"
         assert data["user"]["name"] == "Updated Name"
 
@@ -174,7 +168,7 @@ class TestProfileEndpoints:
         response = client.put("/api/profile", json=invalid_data, headers=auth_headers)
 
         assert response.status_code == 400
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "error" in data
 
     def test_update_profile_unauthenticated(self, client):
@@ -186,8 +180,6 @@ class TestProfileEndpoints:
         assert response.status_code == 401
 
 
-@pytest.mark.unit
-@pytest.mark.api
 class TestDietPlanEndpoints:
     """Test cases for diet plan endpoints."""
 
@@ -201,7 +193,7 @@ class TestDietPlanEndpoints:
         response = client.post("/api/diet-plan", headers=auth_headers)
 
         assert response.status_code == 201
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "plan_name" in data
         assert "total_calories" in data
         assert "plan_data" in data
@@ -220,7 +212,7 @@ class TestDietPlanEndpoints:
         response = client.post("/api/diet-plan", headers=auth_headers)
 
         assert response.status_code == 500
-        data = json.loads(response.data)
+        data = response.get_json()
         assert "error" in data
 
     def test_get_user_diet_plans_authenticated(self, client, auth_headers, sample_diet_plan):
@@ -228,7 +220,7 @@ class TestDietPlanEndpoints:
         response = client.get("/api/diet-plans", headers=auth_headers)
 
         assert response.status_code == 200
-        data = json.loads(response.data)
+        data = response.get_json()
         assert isinstance(data, list)
 
     def test_get_user_diet_plans_unauthenticated(self, client):
@@ -242,7 +234,7 @@ class TestDietPlanEndpoints:
         response = client.get(f"/api/diet-plan/{sample_diet_plan.id}", headers=auth_headers)
 
         assert response.status_code == 200
-        data = json.loads(response.data)
+        data = response.get_json()
         assert data["id"] == sample_diet_plan.id
 
     def test_get_specific_diet_plan_unauthenticated(self, client, sample_diet_plan):
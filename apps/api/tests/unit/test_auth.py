@@ -200,6 +200,7 @@ class TestUserValidation:
 class TestPasswordHashing:
     """Test cases for password hashing functionality."""
 
+    @pytest.mark.no_bcrypt_mock
     def test_password_hashing_consistency(self, sample_user):
         """Test that password hashing is consistent."""
         password = "testpassword123"
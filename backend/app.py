@@ -1,15 +1,23 @@
-import json
+import logging
 import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from enum import IntEnum
 
-import bcrypt
 import google.generativeai as genai
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider, JSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required
 from flask_marshmallow import Marshmallow
 from flask_sqlalchemy import SQLAlchemy
-from marshmallow import Schema, ValidationError, fields
+from marshmallow import Schema, ValidationError
+from passlib.context import CryptContext
+from sqlalchemy import select, update
+from sqlalchemy.orm import defer, raiseload
 
 # Import enhanced modules
 from config import get_config, validate_config
@@ -22,8 +30,26 @@ config_class = get_config(environment)
 print(f"🔧 Using environment: {environment}")
 print(f"🔧 Config class: {config_class.__name__}")
 
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify and plain dict returns"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=DefaultJSONProvider.default).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response - no str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=DefaultJSONProvider.default)
+        return self._app.response_class(body, mimetype="application/json")
+
+
 # Create Flask app with configuration
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config.from_object(config_class)
 
 # Validate configuration
@@ -56,6 +82,27 @@ CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
 genai.configure(api_key=app.config['GEMINI_API_KEY'])
 
 
+# Password hashing
+# bcrypt_sha256 SHA-256s the password before bcrypt so it never truncates at 72
+# bytes or stops at a NUL. Plain bcrypt hashes from older accounts still verify
+# and are flagged for re-hashing on the next successful check.
+pwd_ctx = CryptContext(
+    schemes=["bcrypt_sha256", "bcrypt"],
+    deprecated="auto",
+    bcrypt_sha256__rounds=app.config.get("BCRYPT_ROUNDS", 12),
+)
+# passlib 1.7.4 reads bcrypt.__about__, which bcrypt 4.1 removed, and logs the
+# trapped AttributeError with a traceback; the version is only used for that log
+logging.getLogger("passlib.handlers.bcrypt").setLevel(logging.ERROR)
+
+
+def hash_password(password, rounds=None):
+    """Return a storable hash of the password"""
+    if rounds:
+        return pwd_ctx.handler().using(rounds=rounds).hash(password)
+    return pwd_ctx.hash(password)
+
+
 # Database Models
 class User(db.Model):
     __tablename__ = "users"
@@ -74,17 +121,22 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Relationships
+    diet_plans = db.relationship("DietPlan", back_populates="user", lazy=True)
+    meal_logs = db.relationship("MealLog", back_populates="user", lazy=True)
+
     def set_password(self, password):
         """Hash and set password"""
-        password_bytes = password.encode("utf-8")
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password_bytes, salt).decode("utf-8")
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         """Check if provided password matches hash"""
-        password_bytes = password.encode("utf-8")
-        hash_bytes = self.password_hash.encode("utf-8")
-        return bcrypt.checkpw(password_bytes, hash_bytes)
+        ok, new_hash = pwd_ctx.verify_and_update(password, self.password_hash)
+
+        # Older hash formats are upgraded on a successful check
+        if new_hash:
+            self.password_hash = new_hash
+        return ok
 
     def __repr__(self):
         return f"<User {self.email}>"
@@ -103,8 +155,12 @@ class DietPlan(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    # Relationship
-    user = db.relationship("User", backref=db.backref("diet_plans", lazy=True))
+    # Serves the per-user listing ordered newest first
+    __table_args__ = (db.Index("idx_diet_plans_user_created", user_id, created_at.desc()),)
+
+    # Relationships
+    user = db.relationship("User", back_populates="diet_plans")
+    meal_logs = db.relationship("MealLog", back_populates="diet_plan", lazy=True)
 
     def __repr__(self):
         return f"<DietPlan {self.plan_name} for {self.user.email}>"
@@ -126,244 +182,380 @@ class MealLog(db.Model):
     consumed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (db.Index("idx_meal_logs_user_date", user_id, meal_date),)
+    
     # Relationships
-    user = db.relationship("User", backref=db.backref("meal_logs", lazy=True))
-    diet_plan = db.relationship("DietPlan", backref=db.backref("meal_logs", lazy=True))
+    user = db.relationship("User", back_populates="meal_logs")
+    diet_plan = db.relationship("DietPlan", back_populates="meal_logs")
     
     def __repr__(self):
         return f"<MealLog {self.meal_name} for {self.user.email}>"
 
 
+class DietPlanJob(db.Model):
+    __tablename__ = "diet_plan_jobs"
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    # pending, running, completed, failed
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    diet_plan_id = db.Column(db.Integer, db.ForeignKey("diet_plans.id"), nullable=True)
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    diet_plan = db.relationship("DietPlan")
+
+    def _transition(self, condition, **values):
+        """Apply ``values`` only if the row still matches ``condition``.
+
+        The worker and status polls race on the same row, so every state change
+        is a conditional UPDATE rather than a read-modify-write. Returns True if
+        this call won.
+        """
+        result = db.session.execute(
+            update(DietPlanJob)
+            .where(DietPlanJob.id == self.id, condition)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(self)
+        return result.rowcount == 1
+
+    def start(self):
+        """Claim a pending job for a worker. Returns False if it's no longer pending."""
+        return self._transition(
+            DietPlanJob.status == "pending", status="running", started_at=datetime.utcnow()
+        )
+
+    def finish(self, status, **values):
+        """Record a running job's outcome. Returns False if it was given up on meanwhile."""
+        return self._transition(DietPlanJob.status == "running", status=status, **values)
+
+    def fail_if_stale(self, timeout):
+        """Mark a job failed if it has sat in its current state longer than ``timeout`` seconds.
+
+        Jobs run in process memory, so one whose worker restarted or crashed would
+        otherwise never finish. Pending jobs are timed from ``created_at`` and running
+        ones from ``started_at``, so time spent queued doesn't eat into generation.
+        Returns True if the job was changed.
+        """
+        if self.status not in ("pending", "running"):
+            return False
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        stale = db.or_(
+            db.and_(DietPlanJob.status == "pending", DietPlanJob.created_at < cutoff),
+            db.and_(DietPlanJob.status == "running", DietPlanJob.started_at < cutoff),
+        )
+        return self._transition(stale, status="failed", error="Diet plan generation timed out")
+
+    def __repr__(self):
+        return f"<DietPlanJob {self.id} {self.status}>"
+
+
 # Marshmallow Schemas
-class UserSchema(ma.SQLAlchemySchema):
+# Field lists are spelled out so only these columns get converted, once, at import
+class UserSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = User
+        load_instance = False
+        fields = (
+            "id",
+            "name",
+            "email",
+            "age",
+            "gender",
+            "weight",
+            "height",
+            "activity_level",
+            "diet_preference",
+            "health_goals",
+            "created_at",
+        )
 
-    id = ma.auto_field()
-    name = ma.auto_field()
-    email = ma.auto_field()
-    age = ma.auto_field()
-    gender = ma.auto_field()
-    weight = ma.auto_field()
-    height = ma.auto_field()
-    activity_level = ma.auto_field()
-    diet_preference = ma.auto_field()
-    health_goals = ma.auto_field()
-    created_at = ma.auto_field()
 
+class DietPlanSummarySchema(ma.SQLAlchemyAutoSchema):
+    """Diet plan without its plan_data payload, for listings"""
 
-class DietPlanSchema(ma.SQLAlchemySchema):
     class Meta:
         model = DietPlan
+        load_instance = False
+        include_fk = True
+        fields = (
+            "id",
+            "user_id",
+            "plan_name",
+            "start_date",
+            "end_date",
+            "total_calories",
+            "created_at",
+        )
+
 
-    id = ma.auto_field()
-    user_id = ma.auto_field()
-    plan_name = ma.auto_field()
-    start_date = ma.auto_field()
-    end_date = ma.auto_field()
-    total_calories = ma.auto_field()
-    plan_data = ma.auto_field()
-    created_at = ma.auto_field()
+class DietPlanSchema(DietPlanSummarySchema):
+    class Meta(DietPlanSummarySchema.Meta):
+        # plan_data goes before created_at, where it has always been in the response
+        fields = DietPlanSummarySchema.Meta.fields[:-1] + ("plan_data", "created_at")
+
+
+class DietPlanJobSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = DietPlanJob
+        load_instance = False
+        fields = ("id", "status", "error", "created_at", "diet_plan")
+
+    diet_plan = ma.Nested(DietPlanSchema, allow_none=True)
 
 
 # Initialize schemas
 user_schema = UserSchema()
 users_schema = UserSchema(many=True)
 diet_plan_schema = DietPlanSchema()
-diet_plans_schema = DietPlanSchema(many=True)
+diet_plan_summaries_schema = DietPlanSummarySchema(many=True)
+diet_plan_job_schema = DietPlanJobSchema()
 
 
-def validate_user_data(data, is_update=False):
-    """Validate user data with comprehensive checks"""
-    # Validate required fields with proper validation
-    # For updates, most fields are optional (except password which is handled separately)
-    if is_update:
-        validation_rules = {
-            "name": {"required": False, "min_length": 2, "max_length": 100},
-            "email": {"required": False, "min_length": 5, "max_length": 255},
-            "password": {"required": False, "min_length": 6, "max_length": 100},
-            "age": {"required": False, "min_value": 1, "max_value": 120},
-            "gender": {
-                "required": False,
-                "min_length": 4,
-                "allowed_values": ["male", "female", "other"],
-            },
-            "weight": {"required": False, "min_value": 20, "max_value": 300},
-        }
-    else:
-        validation_rules = {
-            "name": {"required": True, "min_length": 2, "max_length": 100},
-            "email": {"required": True, "min_length": 5, "max_length": 255},
-            "password": {"required": True, "min_length": 6, "max_length": 100},
-            "age": {"required": True, "min_value": 1, "max_value": 120},
-            "gender": {
-                "required": True,
-                "min_length": 4,
-                "allowed_values": ["male", "female", "other"],
-            },
-            "weight": {"required": True, "min_value": 20, "max_value": 300},
-        }
-
-    for field, rules in validation_rules.items():
-        # Check if field is missing
+class ActivityLevel(IntEnum):
+    """Activity levels; the values index _ACTIVITY_MULTIPLIERS"""
+
+    SEDENTARY = 0
+    LIGHT = 1
+    MODERATE = 2
+    ACTIVE = 3
+    VERY_ACTIVE = 4
+
+    @classmethod
+    def parse(cls, value):
+        """Map an activity level string to its member, raising ValueError for unknown levels"""
+        try:
+            return cls[value.strip().upper()]
+        except KeyError:
+            raise ValueError(
+                f"Activity Level must be one of: {', '.join(level.label for level in cls)}"
+            ) from None
+
+    @property
+    def label(self):
+        return self.name.lower()
+
+
+EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+
+# User field rules - create and update differ only in which fields are required
+_USER_FIELD_RULES = {
+    "name": {"min_length": 2, "max_length": 100},
+    "email": {"min_length": 5, "max_length": 255},
+    "password": {"min_length": 6, "max_length": 100},
+    "age": {"min_value": 1, "max_value": 120},
+    "gender": {"min_length": 4, "allowed_values": ["male", "female", "other"]},
+    "weight": {"min_value": 20, "max_value": 300},
+}
+_CREATE_RULES = {field: {**rules, "required": True} for field, rules in _USER_FIELD_RULES.items()}
+_UPDATE_RULES = {field: {**rules, "required": False} for field, rules in _USER_FIELD_RULES.items()}
+
+_OPTIONAL_FIELD_RULES = {
+    "height": {"min_value": 100, "max_value": 250},
+    "health_goals": {"max_length": 500},
+    "activity_level": {"allowed_values": [level.label for level in ActivityLevel]},
+    "diet_preference": {
+        "allowed_values": [
+            "balanced",
+            "vegetarian",
+            "vegan",
+            "keto",
+            "paleo",
+            "mediterranean",
+            "low_carb",
+            "high_protein",
+        ]
+    },
+}
+
+
+def _field_validator(field, rules):
+    """Build the check for one core user field; it may trim or coerce data[field] in place"""
+    required = rules["required"]
+    label = field.title()
+    min_length = rules.get("min_length")
+    max_length = rules.get("max_length")
+    allowed_values = rules.get("allowed_values")
+    min_value = rules.get("min_value")
+    max_value = rules.get("max_value")
+    coerce_number = field in ("age", "weight")
+
+    missing_error = f"Missing required field: {field}" if required else None
+    empty_error = f"{label} cannot be empty"
+    min_length_error = f"{label} must be at least {min_length} characters long"
+    max_length_error = f"{label} must be at most {max_length} characters long"
+    allowed_error = f"{label} must be one of: {', '.join(allowed_values or ())}"
+    min_value_error = f"{label} must be at least {min_value}"
+    max_value_error = f"{label} must be at most {max_value}"
+    number_error = f"{label} must be a valid number"
+
+    def check_range(value):
+        if min_value is not None and value < min_value:
+            return min_value_error
+        if max_value is not None and value > max_value:
+            return max_value_error
+        return None
+
+    def validate(data):
         if field not in data:
-            if rules.get("required", False):
-                return f"Missing required field: {field}"
-            else:
-                continue
+            return missing_error
 
         value = data[field]
-
-        # Check for empty values
-        if value is None or (isinstance(value, str) and value.strip() == ""):
-            return f"{field.title()} cannot be empty"
+        if value is None:
+            return empty_error
 
         # String validation
         if isinstance(value, str):
             value = value.strip()
+            if not value:
+                return empty_error
             data[field] = value  # Update with trimmed value
 
-            if "min_length" in rules and len(value) < rules["min_length"]:
-                return f"{field.title()} must be at least {rules['min_length']} characters long"
+            if min_length is not None and len(value) < min_length:
+                return min_length_error
+            if max_length is not None and len(value) > max_length:
+                return max_length_error
+            if allowed_values is not None and value.lower() not in allowed_values:
+                return allowed_error
+            return None
 
-            if "max_length" in rules and len(value) > rules["max_length"]:
-                return f"{field.title()} must be at most {rules['max_length']} characters long"
+        # Numeric validation
+        if isinstance(value, (int, float)):
+            return check_range(value)
 
-            if "allowed_values" in rules and value.lower() not in rules["allowed_values"]:
-                return f"{field.title()} must be one of: {', '.join(rules['allowed_values'])}"
+        # Type validation
+        if coerce_number:
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                return number_error
+            data[field] = value
+            return check_range(value)
+        return None
 
-        # Numeric validation
-        elif isinstance(value, (int, float)):
-            if "min_value" in rules and value < rules["min_value"]:
-                return f"{field.title()} must be at least {rules['min_value']}"
+    return validate
 
-            if "max_value" in rules and value > rules["max_value"]:
-                return f"{field.title()} must be at most {rules['max_value']}"
 
-        # Type validation
-        else:
-            if field in ["age", "weight"]:
-                try:
-                    value = float(value)
-                    data[field] = value
-                    if "min_value" in rules and value < rules["min_value"]:
-                        return f"{field.title()} must be at least {rules['min_value']}"
-                    if "max_value" in rules and value > rules["max_value"]:
-                        return f"{field.title()} must be at most {rules['max_value']}"
-                except (ValueError, TypeError):
-                    return f"{field.title()} must be a valid number"
-
-    # Email format validation (only if email is provided)
-    if "email" in data:
-        import re
-        email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-        if not re.match(email_pattern, data["email"]):
-            return "Please enter a valid email address"
-
-    # Validate optional fields if provided
-    optional_fields = {
-        "height": {"min_value": 100, "max_value": 250},
-        "health_goals": {"max_length": 500},
-        "activity_level": {
-            "allowed_values": ["sedentary", "light", "moderate", "active", "very_active"]
-        },
-        "diet_preference": {
-            "allowed_values": [
-                "balanced",
-                "vegetarian",
-                "vegan",
-                "keto",
-                "paleo",
-                "mediterranean",
-                "low_carb",
-                "high_protein",
-            ]
-        },
-    }
+def _optional_field_validator(field, rules):
+    """Build the check for one optional profile field; blank strings become None"""
+    label = field.replace("_", " ").title()
+    max_length = rules.get("max_length")
+    allowed_values = rules.get("allowed_values")
+    min_value = rules.get("min_value")
+    max_value = rules.get("max_value")
+    coerce_number = field == "height"
 
-    for field, rules in optional_fields.items():
-        if field in data and data[field] is not None:
-            value = data[field]
+    max_length_error = f"{label} must be at most {max_length} characters long"
+    allowed_error = f"{label} must be one of: {', '.join(allowed_values or ())}"
+    min_value_error = f"{label} must be at least {min_value} cm"
+    max_value_error = f"{label} must be at most {max_value} cm"
+    number_error = f"{label} must be a valid number"
 
+    def validate(data):
+        value = data.get(field)
+        if value is None:
+            return None
+
+        # String validation for optional fields
+        if isinstance(value, str):
+            value = value.strip()
             # Skip validation if empty string (optional field)
-            if isinstance(value, str) and value.strip() == "":
-                data[field] = None
-                continue
-
-            # String validation for optional fields
-            if isinstance(value, str):
-                value = value.strip()
-                data[field] = value
-
-                if "max_length" in rules and len(value) > rules["max_length"]:
-                    return f"{field.replace('_', ' ').title()} must be at most {rules['max_length']} characters long"
-
-                if "allowed_values" in rules and value.lower() not in rules["allowed_values"]:
-                    return f"{field.replace('_', ' ').title()} must be one of: {', '.join(rules['allowed_values'])}"
-
-            # Numeric validation for height
-            elif field == "height":
-                try:
-                    value = float(value)
-                    data[field] = value
-                    if "min_value" in rules and value < rules["min_value"]:
-                        return f"Height must be at least {rules['min_value']} cm"
-                    if "max_value" in rules and value > rules["max_value"]:
-                        return f"Height must be at most {rules['max_value']} cm"
-                except (ValueError, TypeError):
-                    return "Height must be a valid number"
+            data[field] = value or None
+            if not value:
+                return None
+
+            if max_length is not None and len(value) > max_length:
+                return max_length_error
+            if allowed_values is not None and value.lower() not in allowed_values:
+                return allowed_error
+            return None
+
+        # Numeric validation for height
+        if coerce_number:
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                return number_error
+            data[field] = value
+            if min_value is not None and value < min_value:
+                return min_value_error
+            if max_value is not None and value > max_value:
+                return max_value_error
+        return None
+
+    return validate
+
+
+def _validate_email_format(data):
+    """Email format validation (only if email is provided)"""
+    if "email" not in data:
+        return None
+    email = data["email"]
+    # Cheap prefilter: EMAIL_RE needs a local part, an "@" and a dot after it
+    at = email.find("@")
+    if at < 1 or "." not in email[at + 1:] or not EMAIL_RE.match(email):
+        return "Please enter a valid email address"
+    return None
+
+
+def _build_user_validators(field_rules):
+    return (
+        [_field_validator(field, rules) for field, rules in field_rules.items()]
+        + [_validate_email_format]
+        + [_optional_field_validator(field, rules) for field, rules in _OPTIONAL_FIELD_RULES.items()]
+    )
 
+
+# Built once at import so validation is a flat run of prepared checks
+_CREATE_VALIDATORS = _build_user_validators(_CREATE_RULES)
+_UPDATE_VALIDATORS = _build_user_validators(_UPDATE_RULES)
+
+
+def validate_user_data(data, is_update=False):
+    """Validate user data with comprehensive checks"""
+    # For updates, most fields are optional (except password which is handled separately)
+    for validator in _UPDATE_VALIDATORS if is_update else _CREATE_VALIDATORS:
+        error = validator(data)
+        if error:
+            return error
     return None  # No validation errors
 
 
 def calculate_bmr(weight, height, age, gender):
-    """Calculate Basal Metabolic Rate using Mifflin-St Jeor Equation"""
-    if gender.lower() == "male":
-        bmr = 10 * float(weight) + 6.25 * float(height) - 5 * age + 5
-    else:
-        bmr = 10 * float(weight) + 6.25 * float(height) - 5 * age - 161
-    return round(bmr)
+    """Calculate Basal Metabolic Rate using Mifflin-St Jeor Equation (float inputs, lower-case gender)"""
+    offset = 5 if gender == "male" else -161
+    return round(10 * weight + 6.25 * height - 5 * age + offset)
 
 
-def calculate_tdee(bmr, activity_level):
-    """Calculate Total Daily Energy Expenditure"""
-    activity_multipliers = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "active": 1.725,
-        "very_active": 1.9,
-    }
-    return round(bmr * activity_multipliers.get(activity_level.lower(), 1.55))
+_ACTIVITY_MULTIPLIERS = (1.2, 1.375, 1.55, 1.725, 1.9)
 
 
-def generate_diet_plan_with_gemini(user_data):
-    """Generate diet plan using Gemini AI"""
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
+def calculate_tdee(bmr, activity_level):
+    """Calculate Total Daily Energy Expenditure for an ActivityLevel"""
+    return round(bmr * _ACTIVITY_MULTIPLIERS[activity_level])
 
-        # Calculate calories
-        bmr = calculate_bmr(
-            user_data["weight"], user_data["height"], user_data["age"], user_data["gender"]
-        )
-        tdee = calculate_tdee(bmr, user_data["activity_level"])
 
-        # Create prompt for Gemini
-        prompt = f"""
-        Create a detailed 1-week diet plan for a {user_data['age']}-year-old {user_data['gender']} person.
+# Prompt for Gemini, filled in per request with the user details and tdee
+_PROMPT_TEMPLATE = """
+        Create a detailed 1-week diet plan for a {age}-year-old {gender} person.
         
         User Details:
-        - Weight: {user_data['weight']} kg
-        - Height: {user_data['height']} cm
-        - Activity Level: {user_data['activity_level']}
-        - Diet Preference: {user_data['diet_preference']}
-        - Health Goals: {user_data['health_goals']}
+        - Weight: {weight} kg
+        - Height: {height} cm
+        - Activity Level: {activity_level.label}
+        - Diet Preference: {diet_preference}
+        - Health Goals: {health_goals}
         - Daily Calorie Target: {tdee} calories
         
         Requirements:
         1. Create a 7-day meal plan with breakfast, lunch, dinner, and 2 snacks
         2. Each meal should include specific foods, portions, and calorie counts
-        3. Ensure the plan is {user_data['diet_preference']} friendly
+        3. Ensure the plan is {diet_preference} friendly
         4. Include nutritional information (protein, carbs, fat) for each meal
         5. Provide variety and ensure meals are practical and easy to prepare
         6. Consider the health goals mentioned
@@ -402,6 +594,20 @@ def generate_diet_plan_with_gemini(user_data):
         Make sure the JSON is valid and well-formatted.
         """
 
+
+def generate_diet_plan_with_gemini(user_data):
+    """Generate diet plan using Gemini AI"""
+    try:
+        model = genai.GenerativeModel("gemini-1.5-flash")
+
+        # Calculate calories
+        bmr = calculate_bmr(
+            user_data["weight"], user_data["height"], user_data["age"], user_data["gender"].lower()
+        )
+        tdee = calculate_tdee(bmr, user_data["activity_level"])
+
+        prompt = _PROMPT_TEMPLATE.format(tdee=tdee, **user_data)
+
         response = model.generate_content(prompt)
 
         # Parse the response and extract JSON
@@ -409,13 +615,15 @@ def generate_diet_plan_with_gemini(user_data):
 
         # Try to extract JSON from the response
         try:
-            # Look for JSON in the response
-            start_idx = response_text.find("{")
-            end_idx = response_text.rfind("}") + 1
-            json_str = response_text[start_idx:end_idx]
-            diet_plan = json.loads(json_str)
-            return diet_plan
-        except json.JSONDecodeError:
+            try:
+                # The prompt asks for bare JSON, so try the whole reply first
+                return orjson.loads(response_text)
+            except orjson.JSONDecodeError:
+                # Look for JSON in the response (e.g. wrapped in a code fence)
+                start_idx = response_text.find("{")
+                end_idx = response_text.rfind("}") + 1
+                return orjson.loads(response_text[start_idx:end_idx])
+        except orjson.JSONDecodeError:
             # If JSON parsing fails, create a structured response
             return {
                 "total_calories_per_day": tdee,
@@ -430,6 +638,118 @@ def generate_diet_plan_with_gemini(user_data):
         return None
 
 
+def load_diet_plan_inputs(user_id):
+    """Build the Gemini inputs from a user's profile, or None if the user doesn't exist"""
+    # Only the profile columns are needed - skip building a User object
+    user = db.session.execute(
+        select(
+            User.age,
+            User.gender,
+            User.weight,
+            User.height,
+            User.activity_level,
+            User.diet_preference,
+            User.health_goals,
+        ).where(User.id == user_id)
+    ).first()
+    if not user:
+        return None
+
+    return {
+        "age": user.age,
+        "gender": user.gender,
+        "weight": float(user.weight),
+        "height": float(user.height) if user.height else 170,
+        "activity_level": (
+            ActivityLevel.parse(user.activity_level) if user.activity_level else ActivityLevel.MODERATE
+        ),
+        "diet_preference": user.diet_preference or "balanced",
+        "health_goals": user.health_goals or "Maintain healthy weight",
+    }
+
+
+def save_diet_plan(user_id, user_data, diet_plan_data):
+    """Add a one-week DietPlan starting today to the session (the caller commits)"""
+    # Calculate start and end dates (1 week from today)
+    start_date = datetime.now().date()
+    end_date = start_date + timedelta(days=6)
+
+    # Create diet plan record
+    new_diet_plan = DietPlan(
+        user_id=user_id,
+        plan_name=f"1-Week {user_data['diet_preference'].title()} Diet Plan",
+        start_date=start_date,
+        end_date=end_date,
+        total_calories=diet_plan_data.get("total_calories_per_day", 2000),
+        plan_data=diet_plan_data,
+    )
+    db.session.add(new_diet_plan)
+    return new_diet_plan
+
+
+# Queued diet plan jobs run here; their state lives in the database so any
+# gunicorn worker can answer the status poll
+diet_plan_executor = ThreadPoolExecutor(max_workers=app.config.get("DIET_PLAN_WORKERS", 2))
+
+
+def run_diet_plan_job(job_id, user_id, user_data):
+    """Generate the plan for a queued job and record the outcome"""
+    with app.app_context():
+        job = db.session.get(DietPlanJob, job_id)
+        try:
+            # Already given up on by a status poll
+            if job is None or not job.start():
+                return
+            db.session.commit()
+
+            diet_plan_data = generate_diet_plan_with_gemini(user_data)
+            if diet_plan_data:
+                diet_plan = save_diet_plan(user_id, user_data, diet_plan_data)
+                db.session.flush()
+                finished = job.finish("completed", diet_plan_id=diet_plan.id)
+            else:
+                finished = job.finish("failed", error="Failed to generate diet plan")
+            if finished:
+                db.session.commit()
+            else:
+                # Timed out while generating; the poll has already reported it failed
+                db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Diet plan job {job_id} failed: {str(e)}")
+            try:
+                job.finish("failed", error="Internal server error")
+                db.session.commit()
+            except Exception as commit_error:
+                db.session.rollback()
+                app.logger.error(
+                    f"Could not record failure of diet plan job {job_id}: {str(commit_error)}"
+                )
+        finally:
+            db.session.remove()
+
+
+def get_current_user():
+    """Load the JWT's user once per request and keep it on g (None if the user is gone)"""
+    if "current_user" not in g:
+        g.current_user = db.session.get(User, get_jwt_identity())
+    return g.current_user
+
+
+@app.teardown_request
+def forget_current_user(exc):
+    """Drop the cached user - g outlives the request when an app context is already pushed"""
+    g.pop("current_user", None)
+
+
+def strict_loading():
+    """Loader options that make stray lazy loads raise, in testing and debug only.
+
+    In production an unexpected lazy load should cost a query, not a 500.
+    """
+    return (raiseload("*"),) if app.testing or app.debug else ()
+
+
 # API Routes
 @app.route("/api/register", methods=["POST"])
 def register():
@@ -517,6 +837,10 @@ def login():
             app.logger.warning(f"Failed login attempt for user: {email} from {client_ip}")
             return jsonify({"error": "Invalid email or password"}), 401
 
+        # check_password may have upgraded a legacy hash - persist it
+        if user in db.session.dirty:
+            db.session.commit()
+
         # Successful login - create access token
         access_token = create_access_token(identity=user.id)
         
@@ -543,8 +867,9 @@ def login():
 def get_profile():
     """Get current user profile"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
         return user_schema.dump(user), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -555,8 +880,9 @@ def get_profile():
 def update_profile():
     """Update current user profile"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
         data = request.get_json()
 
         # Remove password from validation if not provided
@@ -614,39 +940,20 @@ def generate_diet_plan():
     """Generate a new diet plan"""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
+        try:
+            user_data = load_diet_plan_inputs(current_user_id)
+        except ValueError as e:  # stored profile no longer passes validation
+            return jsonify({"error": str(e)}), 400
+        if not user_data:
+            return jsonify({"error": "User not found"}), 404
 
         # Generate diet plan using Gemini
-        user_data = {
-            "age": user.age,
-            "gender": user.gender,
-            "weight": float(user.weight),
-            "height": float(user.height) if user.height else 170,
-            "activity_level": user.activity_level or "moderate",
-            "diet_preference": user.diet_preference or "balanced",
-            "health_goals": user.health_goals or "Maintain healthy weight",
-        }
-
         diet_plan_data = generate_diet_plan_with_gemini(user_data)
 
         if not diet_plan_data:
             return jsonify({"error": "Failed to generate diet plan"}), 500
 
-        # Calculate start and end dates (1 week from today)
-        start_date = datetime.now().date()
-        end_date = start_date + timedelta(days=6)
-
-        # Create diet plan record
-        new_diet_plan = DietPlan(
-            user_id=user.id,
-            plan_name=f"1-Week {user.diet_preference.title()} Diet Plan",
-            start_date=start_date,
-            end_date=end_date,
-            total_calories=diet_plan_data.get("total_calories_per_day", 2000),
-            plan_data=diet_plan_data,
-        )
-
-        db.session.add(new_diet_plan)
+        new_diet_plan = save_diet_plan(current_user_id, user_data, diet_plan_data)
         db.session.commit()
 
         return diet_plan_schema.dump(new_diet_plan), 201
@@ -656,6 +963,49 @@ def generate_diet_plan():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/diet-plan/jobs", methods=["POST"])
+@jwt_required()
+def queue_diet_plan():
+    """Queue diet plan generation and return a job to poll"""
+    try:
+        current_user_id = get_jwt_identity()
+        try:
+            user_data = load_diet_plan_inputs(current_user_id)
+        except ValueError as e:  # stored profile no longer passes validation
+            return jsonify({"error": str(e)}), 400
+        if not user_data:
+            return jsonify({"error": "User not found"}), 404
+
+        job = DietPlanJob(user_id=current_user_id)
+        db.session.add(job)
+        db.session.commit()
+
+        # The Gemini round-trip runs off the request thread
+        diet_plan_executor.submit(run_diet_plan_job, job.id, current_user_id, user_data)
+
+        return diet_plan_job_schema.dump(job), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/diet-plan/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_diet_plan_job(job_id):
+    """Get the status of a queued diet plan, with the plan once it's ready"""
+    try:
+        current_user_id = get_jwt_identity()
+        job = DietPlanJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job.fail_if_stale(app.config.get("DIET_PLAN_JOB_TIMEOUT", 300)):
+            db.session.commit()
+        return diet_plan_job_schema.dump(job), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/diet-plans", methods=["GET"])
 @jwt_required()
 def get_user_diet_plans():
@@ -663,11 +1013,13 @@ def get_user_diet_plans():
     try:
         current_user_id = get_jwt_identity()
         diet_plans = (
-            DietPlan.query.filter_by(user_id=current_user_id)
+            DietPlan.query.options(*strict_loading(), defer(DietPlan.plan_data))
+            .filter_by(user_id=current_user_id)
             .order_by(DietPlan.created_at.desc())
             .all()
         )
-        return diet_plans_schema.dump(diet_plans), 200
+        # plan_data is only sent by /api/diet-plan/<id>
+        return diet_plan_summaries_schema.dump(diet_plans), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -678,7 +1030,11 @@ def get_diet_plan(plan_id):
     """Get a specific diet plan"""
     try:
         current_user_id = get_jwt_identity()
-        diet_plan = DietPlan.query.filter_by(id=plan_id, user_id=current_user_id).first()
+        diet_plan = (
+            DietPlan.query.options(*strict_loading())
+            .filter_by(id=plan_id, user_id=current_user_id)
+            .first()
+        )
         if not diet_plan:
             return jsonify({"error": "Diet plan not found"}), 404
         return diet_plan_schema.dump(diet_plan), 200
@@ -4,6 +4,7 @@ Implements secure configuration management for different environments
 """
 
 import os
+import re
 from datetime import timedelta
 from typing import Dict, Any
 from dotenv import load_dotenv
@@ -25,15 +26,19 @@ class BaseConfig:
     POSTGRES_USER = os.getenv('POSTGRES_USER', 'diet_user')
     POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', 'diet_password')
     
+    # psycopg 3 driver - it prepares statements server-side once they repeat
     SQLALCHEMY_DATABASE_URI = (
-        f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@"
+        f"postgresql+psycopg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@"
         f"{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_size': 10,
-        'pool_recycle': 3600,
-        'pool_pre_ping': True
+        'max_overflow': 10,
+        # Recycling stale connections replaces a pre-ping round trip per checkout
+        'pool_recycle': 1800,
+        'pool_pre_ping': False,
+        'connect_args': {'prepare_threshold': 5}
     }
     
     # JWT Configuration
@@ -41,9 +46,15 @@ class BaseConfig:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_ALGORITHM = 'HS256'
     
+    # Password Hashing Configuration
+    BCRYPT_ROUNDS = 12
+    
     # AI Configuration
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     GEMINI_MODEL = 'gemini-1.5-flash'
+    DIET_PLAN_WORKERS = int(os.getenv('DIET_PLAN_WORKERS', 2))
+    # Seconds a job may stay pending before it's reported as failed (e.g. its worker died)
+    DIET_PLAN_JOB_TIMEOUT = int(os.getenv('DIET_PLAN_JOB_TIMEOUT', 300))
     
     # CORS Configuration
     CORS_ORIGINS = [
@@ -112,6 +123,7 @@ class TestingConfig(BaseConfig):
     
     # Use in-memory database for testing
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
     
     # Shorter token expiry for testing
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=10)
@@ -126,6 +138,9 @@ class TestingConfig(BaseConfig):
     # Disable rate limiting for testing
     RATELIMIT_ENABLED = False
     
+    # Minimum bcrypt cost - tests don't need brute-force resistance
+    BCRYPT_ROUNDS = 4
+    
     @staticmethod
     def init_app(app):
         BaseConfig.init_app(app)
@@ -156,7 +171,7 @@ class ProductionConfig(BaseConfig):
         database_url = os.getenv('DATABASE_URL')
         if database_url:
             # Use Render database URL (force override)
-            self.SQLALCHEMY_DATABASE_URI = database_url.replace('postgres://', 'postgresql://')
+            self.SQLALCHEMY_DATABASE_URI = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg://', database_url)
             print(f"✅ Using Render DATABASE_URL: {database_url[:50]}...")
         else:
             print("⚠️ No DATABASE_URL found, using localhost fallback")
@@ -172,9 +187,11 @@ class ProductionConfig(BaseConfig):
     # Database connection pooling for production
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_size': 20,
-        'pool_recycle': 3600,
-        'pool_pre_ping': True,
-        'pool_timeout': 30
+        'max_overflow': 10,
+        'pool_recycle': 1800,
+        'pool_pre_ping': False,
+        'pool_timeout': 30,
+        'connect_args': {'prepare_threshold': 5}
     }
     
     @staticmethod
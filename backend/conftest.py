@@ -1,33 +1,139 @@
 """
 Pytest configuration and fixtures for the Diet Planner backend.
 """
+import hashlib
+import json
 import os
+import pathlib
 import tempfile
+import types
 import pytest
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from app import app, db, User, DietPlan, MealLog
+from typing import Any, Optional
+from app import app, db, hash_password, pwd_ctx, security_manager, User, DietPlan, MealLog
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import close_all_sessions
+from sqlalchemy.schema import CreateIndex, CreateTable
 import factory
 
 
-@pytest.fixture(scope='function')
-def test_app():
-    """Create and configure a test app instance."""
+class _ConnectionBoundSession(Session):
+    """Session that always uses the connection it was bound to.
+
+    Flask-SQLAlchemy picks an engine per bind key and ignores ``bind=``, which
+    would let test writes escape the per-test transaction.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+SCHEMA_HASH_FILE = pathlib.Path(__file__).parent / '.pytest_schema_hash'
+SCHEMA_LOCK_KEY = 8036625  # arbitrary pg advisory lock id for test schema setup
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--force-recreate-db', action='store_true',
+        help='Run db.create_all() even if the schema matches the last run'
+    )
+
+
+def _schema_hash():
+    """Fingerprint the model DDL and the database it targets."""
+    dialect = db.engine.dialect
+    ddl = [db.engine.url.render_as_string(hide_password=True)]
+    for table in db.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes)
+    return hashlib.sha1('\n'.join(ddl).encode()).hexdigest()
+
+
+def _schema_is_current(connection, schema_hash):
+    """True if the last run recorded this schema and every table still exists."""
+    url = connection.engine.url
+    # An in-memory database starts empty in every process
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return False
+    if not SCHEMA_HASH_FILE.exists() or SCHEMA_HASH_FILE.read_text() != schema_hash:
+        return False
+    inspector = inspect(connection)
+    return all(inspector.has_table(table.name) for table in db.metadata.sorted_tables)
+
+
+def _use_sqlalchemy_begin(engine):
+    """Let SQLAlchemy emit BEGIN on SQLite so db_session's SAVEPOINTs actually roll back.
+
+    pysqlite defers BEGIN on its own, which leaves the outer test transaction
+    empty and lets view commits persist (SQLAlchemy's documented pysqlite recipe).
+    """
+    @event.listens_for(engine, 'connect')
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _emit_begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+    # Start again from connections that pick up the listeners
+    engine.dispose()
+
+
+def _remove_talisman_hooks(flask_app):
+    """Unregister Talisman's before/after request hooks, if it was installed."""
+    talisman = security_manager.talisman
+    if talisman is None:
+        return
+    hooks = (talisman._force_https, talisman._make_nonce, talisman._set_response_headers)
+    for funcs in (flask_app.before_request_funcs, flask_app.after_request_funcs):
+        funcs[None] = [f for f in funcs.get(None, []) if f not in hooks]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _fast_password_hashing():
+    """Hash with the minimum bcrypt cost, including tests that never load test_app."""
+    # pwd_ctx read the rounds at import; lower them for the session
+    pwd_ctx.update(bcrypt_sha256__rounds=4)
+
+
+@pytest.fixture(scope='session')
+def test_app(pytestconfig):
+    """Create and configure the test app once for the whole session."""
     # Just use the existing app but create separate test tables
-    app.config['TESTING'] = True
-    app.config['JWT_SECRET_KEY'] = 'test-jwt-secret'
-    app.config['SECRET_KEY'] = 'test-secret-key'
-    app.config['WTF_CSRF_ENABLED'] = False
+    app.config.update(
+        TESTING=True,
+        JWT_SECRET_KEY='test-jwt-secret',
+        SECRET_KEY='test-secret-key',
+        WTF_CSRF_ENABLED=False,
+        BCRYPT_ROUNDS=4,
+    )
+    # Talisman was installed before TESTING was set; drop its per-request hooks
+    _remove_talisman_hooks(app)
     
     with app.app_context():
-        # Create tables if they don't exist (PostgreSQL will be used)
-        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            _use_sqlalchemy_begin(db.engine)
+        
+        # Create tables if they don't exist, unless the models haven't changed
+        # since the last run and the tables are still there
+        with db.engine.begin() as connection:
+            # xdist workers share a PostgreSQL database; let one create the tables at a time
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+            schema_hash = _schema_hash()
+            if pytestconfig.getoption('force_recreate_db') or not _schema_is_current(connection, schema_hash):
+                db.metadata.create_all(connection)
+                SCHEMA_HASH_FILE.write_text(schema_hash)
         yield app
-        # Don't drop tables - just clean data in teardown
+        # Don't drop tables - each test rolls back its own transaction
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def client(test_app):
-    """Create a test client."""
+    """Create a test client once; the app sets no cookies, so nothing carries over between tests."""
     return test_app.test_client()
 
 
@@ -40,21 +146,55 @@ def app_context(test_app):
 
 @pytest.fixture
 def db_session(app_context):
-    """Create a database session for testing."""
-    # Clean up any existing test data
-    db.session.query(DietPlan).delete()
-    db.session.query(MealLog).delete()
-    db.session.query(User).delete()
-    db.session.commit()
+    """Create a database session for testing.
+
+    The session is joined to an outer transaction on a dedicated connection;
+    ``commit()`` calls made by tests or views only release a SAVEPOINT, and the
+    outer transaction is rolled back on teardown so no data outlives the test.
+    """
+    # Release anything an earlier request left open (its session may belong to another
+    # app context); in-memory SQLite has a single connection
+    close_all_sessions()
+    connection = db.engine.connect()
+    transaction = connection.begin()
+
+    original_session = db.session
+    db.session = db._make_scoped_session({
+        'class_': _ConnectionBoundSession,
+        'bind': connection,
+        'join_transaction_mode': 'create_savepoint',
+    })
     
     yield db.session
     
-    # Clean up after test
-    db.session.rollback()
-    db.session.query(DietPlan).delete()
-    db.session.query(MealLog).delete()
-    db.session.query(User).delete()
-    db.session.commit()
+    # Discard everything the test wrote
+    db.session.remove()
+    transaction.rollback()
+    connection.close()
+    db.session = original_session
+
+
+@pytest.fixture
+def count_queries(db_session):
+    """Context manager that records the SQL statements run inside it."""
+    @contextmanager
+    def _count():
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _record)
+
+    return _count
+
+
+# Every factory user shares one "password123" hash, computed once at minimum cost
+_CACHED_PW_HASH = hash_password('password123', rounds=4)
 
 
 # Factories for test data generation
@@ -63,7 +203,7 @@ class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
     
     class Meta:
         model = User
-        sqlalchemy_session_persistence = 'commit'
+        sqlalchemy_session_persistence = 'flush'
     
     name = factory.Faker('name')
     email = factory.Faker('email')
@@ -76,15 +216,34 @@ class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
     diet_preference = factory.Faker('random_element',
                                    elements=['balanced', 'vegetarian', 'vegan', 'keto', 'paleo'])
     health_goals = factory.Faker('text', max_nb_chars=200)
-    password_hash = factory.LazyFunction(lambda: _hash_password("password123"))
+    password_hash = factory.LazyFunction(lambda: _CACHED_PW_HASH)
 
 
-def _hash_password(password):
-    """Helper function to hash password for factory."""
-    import bcrypt
-    password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+# Built once and serialized; each plan decodes its own copy so tests can mutate it
+_PLAN_DATA_JSON = json.dumps({
+    "daily_plans": [
+        {
+            "day": f"Day {i+1}",
+            "date": (datetime.now() + timedelta(days=i)).isoformat(),
+            "meals": [
+                {
+                    "meal_type": "Breakfast",
+                    "name": "Test Breakfast",
+                    "foods": [
+                        {
+                            "name": "Oatmeal",
+                            "portion": "1 cup",
+                            "calories": 150,
+                            "protein": 5,
+                            "carbs": 30,
+                            "fat": 3
+                        }
+                    ]
+                }
+            ]
+        } for i in range(7)
+    ]
+})
 
 
 class DietPlanFactory(factory.alchemy.SQLAlchemyModelFactory):
@@ -92,37 +251,60 @@ class DietPlanFactory(factory.alchemy.SQLAlchemyModelFactory):
     
     class Meta:
         model = DietPlan
-        sqlalchemy_session_persistence = 'commit'
+        sqlalchemy_session_persistence = 'flush'
     
     user = factory.SubFactory(UserFactory)
     plan_name = factory.Faker('sentence', nb_words=3)
     start_date = factory.Faker('date_this_month')
     end_date = factory.LazyAttribute(lambda obj: obj.start_date + timedelta(days=7))
     total_calories = factory.Faker('random_int', min=1200, max=3000)
-    plan_data = factory.LazyFunction(lambda: {
-        "daily_plans": [
-            {
-                "day": f"Day {i+1}",
-                "date": (datetime.now() + timedelta(days=i)).isoformat(),
-                "meals": [
-                    {
-                        "meal_type": "Breakfast",
-                        "name": "Test Breakfast",
-                        "foods": [
-                            {
-                                "name": "Oatmeal",
-                                "portion": "1 cup",
-                                "calories": 150,
-                                "protein": 5,
-                                "carbs": 30,
-                                "fat": 3
-                            }
-                        ]
-                    }
-                ]
-            } for i in range(7)
-        ]
-    })
+    plan_data = factory.LazyFunction(lambda: json.loads(_PLAN_DATA_JSON))
+
+
+def make_users(n, session, **kwargs):
+    """Build n users and insert them with one batched INSERT."""
+    users = UserFactory.build_batch(n, **kwargs)
+    session.add_all(users)
+    session.commit()
+    return users
+
+
+def make_diet_plans(n, session, user=None):
+    """Build n diet plans - for ``user``, or one new user each - and insert them in batches."""
+    owners = [user] * n if user is not None else make_users(n, session)
+    plans = [DietPlanFactory.build(user=owner) for owner in owners]
+    session.add_all(plans)
+    session.commit()
+    return plans
+
+
+@dataclass(slots=True)
+class UserPayload:
+    """Registration payload for validation tests; the defaults are the minimal valid user."""
+    
+    name: str = 'John Doe'
+    email: str = 'john@example.com'
+    password: str = 'password123'
+    age: Any = 30
+    gender: str = 'male'
+    weight: Any = 75
+    height: Any = None
+    activity_level: Optional[str] = None
+    diet_preference: Optional[str] = None
+    health_goals: Optional[str] = None
+    
+    def as_dict(self):
+        """Request-body dict; optional fields left as None are omitted."""
+        return {
+            field: value for field in self.__slots__
+            if (value := getattr(self, field)) is not None
+        }
+
+
+@pytest.fixture(scope='session')
+def precomputed_hash():
+    """Hash of "password123" for tests that just need a valid password_hash."""
+    return _CACHED_PW_HASH
 
 
 @pytest.fixture
@@ -134,6 +316,12 @@ def sample_user(db_session):
     return user
 
 
+@pytest.fixture
+def unsaved_user():
+    """A User built in memory only, for tests that never touch the database."""
+    return UserFactory.build()
+
+
 @pytest.fixture
 def sample_diet_plan(db_session, sample_user):
     """Create a sample diet plan for testing."""
@@ -155,10 +343,10 @@ def auth_headers(client, sample_user):
     return {'Authorization': f'Bearer {token}'}
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def mock_gemini_response():
-    """Mock Gemini API response for testing."""
-    return {
+    """Mock Gemini API response for testing, shared read-only; deep-copy before handing it to the app."""
+    return types.MappingProxyType({
         "plan_name": "Test 7-Day Balanced Diet Plan",
         "daily_plans": [
             {
@@ -190,4 +378,4 @@ def mock_gemini_response():
                 ]
             }
         ]
-    }
+    })
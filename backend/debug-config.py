@@ -43,11 +43,12 @@ def debug_configuration():
     try:
         import psycopg2
         if database_url:
-            conn = psycopg2.connect(database_url)
+            conn = psycopg2.connect(database_url, connect_timeout=3, application_name='diet-planner-debug')
             cursor = conn.cursor()
-            cursor.execute("SELECT version();")
-            version = cursor.fetchone()[0]
-            print(f"✅ Connection successful: {version[:50]}...")
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            # libpq reports the server version from the handshake, no query needed
+            print(f"✅ Connection successful: PostgreSQL server version {conn.server_version}")
             cursor.close()
             conn.close()
         else:
@@ -3,24 +3,62 @@ Application Monitoring and Health Checks
 Implements comprehensive monitoring for production readiness
 """
 
+import itertools
+import os
+import threading
 import time
+from collections import deque
 import psutil
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-from flask import Flask, jsonify, request
+from flask import Flask, g, has_request_context, jsonify, request
 import sqlalchemy
 from sqlalchemy import text
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, generate_latest
+
+
+# Prometheus metrics - gauges are only sampled when /metrics is scraped
+REQUESTS = Counter('diet_planner_requests', 'Requests handled')
+ERRORS = Counter('diet_planner_errors', 'Responses with a 4xx or 5xx status')
+UPTIME = Gauge('diet_planner_uptime_seconds', 'Seconds since the monitor started')
+MEMORY = Gauge('diet_planner_memory_bytes', 'Resident memory of this process')
+CPU = Gauge('diet_planner_cpu_usage_percent', 'System CPU usage from the background sampler')
+MEMORY.set_function(lambda: psutil.Process().memory_info().rss)
+
+
+def request_timestamp() -> str:
+    """ISO timestamp of the current request, formatted on first use and cached on g"""
+    start_time = getattr(request, 'start_time', None) if has_request_context() else None
+    if start_time is None:
+        return datetime.utcnow().isoformat()
+    # Keyed by start time, since g can outlive a request when an app context is reused
+    cached = g.get('request_time_iso')
+    if cached is None or cached[0] != start_time:
+        cached = g.request_time_iso = (start_time, datetime.utcfromtimestamp(start_time).isoformat())
+    return cached[1]
 
 
 class ApplicationMonitor:
     """Centralized application monitoring"""
     
+    SAMPLE_INTERVAL = 5  # seconds between background system samples
+    HEALTH_CACHE_TTL = 2  # seconds a health report is reused for
+    
     def __init__(self, app: Optional[Flask] = None):
         self.app = app
         self.start_time = time.time()
         self.request_count = 0
         self.error_count = 0
+        # next() on a count is atomic, so threaded workers can't lose increments
+        self._request_ids = itertools.count(1)
+        self._error_ids = itertools.count(1)
+        
+        # (cpu_percent, virtual_memory, disk_usage), replaced whole by the sampler
+        self._system_sample = None
+        self._sampler_pid = None
+        self._sampler_lock = threading.Lock()
+        self._health_cache = None  # (expires_at, health_data)
         
         if app:
             self.init_app(app)
@@ -28,12 +66,15 @@ class ApplicationMonitor:
     def init_app(self, app: Flask):
         """Initialize monitoring for Flask app"""
         self.app = app
+        UPTIME.set_function(lambda: time.time() - self.start_time)
+        CPU.set_function(self._cached_cpu_percent)
         
         # Setup request monitoring
         @app.before_request
         def before_request():
             request.start_time = time.time()
-            self.request_count += 1
+            request.request_id = self.request_count = next(self._request_ids)
+            REQUESTS.inc()
         
         @app.after_request
         def after_request(response):
@@ -47,7 +88,8 @@ class ApplicationMonitor:
             
             # Count errors
             if response.status_code >= 400:
-                self.error_count += 1
+                self.error_count = next(self._error_ids)
+                ERRORS.inc()
             
             return response
         
@@ -57,7 +99,7 @@ class ApplicationMonitor:
             return jsonify({
                 'error': 'Resource not found',
                 'status': 404,
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': request_timestamp()
             }), 404
         
         @app.errorhandler(500)
@@ -66,16 +108,27 @@ class ApplicationMonitor:
             return jsonify({
                 'error': 'Internal server error',
                 'status': 500,
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': request_timestamp()
             }), 500
     
     def get_health_status(self) -> Dict[str, Any]:
-        """Get comprehensive health status"""
+        """Get comprehensive health status, reusing a report for HEALTH_CACHE_TTL seconds"""
+        now = time.monotonic()
+        cached = self._health_cache
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        health_data = self._build_health_status()
+        self._health_cache = (now + self.HEALTH_CACHE_TTL, health_data)
+        return health_data
+    
+    def _build_health_status(self) -> Dict[str, Any]:
+        """Run the health checks"""
         from app import db
         
         health_data = {
             'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': request_timestamp(),
             'uptime': time.time() - self.start_time,
             'version': '1.0.0',
             'environment': self.app.config.get('FLASK_ENV', 'unknown'),
@@ -83,18 +136,9 @@ class ApplicationMonitor:
         }
         
         # Database health check
-        try:
-            db.session.execute(text('SELECT 1'))
-            health_data['checks']['database'] = {
-                'status': 'healthy',
-                'response_time': self._measure_db_response_time()
-            }
-        except Exception as e:
+        health_data['checks']['database'] = self._check_database()
+        if health_data['checks']['database']['status'] != 'healthy':
             health_data['status'] = 'unhealthy'
-            health_data['checks']['database'] = {
-                'status': 'unhealthy',
-                'error': str(e)
-            }
         
         # System resource checks
         health_data['checks']['system'] = self._get_system_health()
@@ -107,23 +151,56 @@ class ApplicationMonitor:
         
         return health_data
     
-    def _measure_db_response_time(self) -> float:
-        """Measure database response time"""
+    def _check_database(self) -> Dict[str, Any]:
+        """Ping the database once, timing the round-trip"""
         from app import db
         
         start_time = time.time()
         try:
             db.session.execute(text('SELECT 1'))
-            return round((time.time() - start_time) * 1000, 2)  # Return in milliseconds
-        except Exception:
-            return -1
+        except Exception as e:
+            return {'status': 'unhealthy', 'error': str(e)}
+        return {
+            'status': 'healthy',
+            'response_time': round((time.time() - start_time) * 1000, 2),  # milliseconds
+            'pool': db.engine.pool.status()
+        }
+    
+    def _sample_system(self, cpu_interval: Optional[float] = None):
+        """Read CPU, memory and disk usage in one go"""
+        # interval=None doesn't block - it reports usage since the previous call
+        self._system_sample = (
+            psutil.cpu_percent(interval=cpu_interval),
+            psutil.virtual_memory(),
+            psutil.disk_usage('/')
+        )
+    
+    def _sampler(self):
+        """Refresh the system sample every SAMPLE_INTERVAL seconds"""
+        while True:
+            time.sleep(self.SAMPLE_INTERVAL)
+            try:
+                self._sample_system()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"System sampling failed: {str(e)}")
+    
+    def _ensure_sampler(self):
+        """Start the sampler thread in this process - threads don't survive a --preload fork"""
+        if self._sampler_pid == os.getpid():
+            return
+        with self._sampler_lock:
+            if self._sampler_pid == os.getpid():
+                return
+            # The first non-blocking reading would span process startup, so take a short real one
+            self._sample_system(cpu_interval=0.1)
+            threading.Thread(target=self._sampler, daemon=True).start()
+            self._sampler_pid = os.getpid()
     
     def _get_system_health(self) -> Dict[str, Any]:
         """Get system resource health metrics"""
         try:
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            self._ensure_sampler()
+            cpu_percent, memory, disk = self._system_sample
             
             system_health = {
                 'status': 'healthy',
@@ -175,13 +252,13 @@ class ApplicationMonitor:
             genai.configure(api_key=self.app.config.get('GEMINI_API_KEY', 'test'))
             services['gemini_ai'] = {
                 'status': 'healthy',
-                'last_checked': datetime.utcnow().isoformat()
+                'last_checked': request_timestamp()
             }
         except Exception as e:
             services['gemini_ai'] = {
                 'status': 'unhealthy',
                 'error': str(e),
-                'last_checked': datetime.utcnow().isoformat()
+                'last_checked': request_timestamp()
             }
         
         return services
@@ -194,16 +271,22 @@ class ApplicationMonitor:
             'error_count': self.error_count,
             'error_rate': self.error_count / max(self.request_count, 1),
             'memory_usage_mb': psutil.Process().memory_info().rss / 1024 / 1024,
-            'cpu_usage_percent': psutil.cpu_percent()
+            'cpu_usage_percent': self._cached_cpu_percent()
         }
+    
+    def _cached_cpu_percent(self) -> float:
+        """CPU usage from the sampler - calling cpu_percent() here would reset its window"""
+        self._ensure_sampler()
+        return self._system_sample[0]
 
 
 class PerformanceProfiler:
     """Performance profiling for optimization"""
     
     def __init__(self):
-        self.slow_queries = []
-        self.slow_requests = []
+        # Only the last 100 of each are kept; deque drops the oldest on append
+        self.slow_queries: deque = deque(maxlen=100)
+        self.slow_requests: deque = deque(maxlen=100)
     
     def profile_query(self, query: str, execution_time: float):
         """Profile database query performance"""
@@ -211,11 +294,8 @@ class PerformanceProfiler:
             self.slow_queries.append({
                 'query': query[:200],  # Truncate long queries
                 'execution_time': execution_time,
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': request_timestamp()
             })
-            
-            # Keep only last 100 slow queries
-            self.slow_queries = self.slow_queries[-100:]
     
     def profile_request(self, endpoint: str, method: str, execution_time: float):
         """Profile request performance"""
@@ -224,17 +304,14 @@ class PerformanceProfiler:
                 'endpoint': endpoint,
                 'method': method,
                 'execution_time': execution_time,
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': request_timestamp()
             })
-            
-            # Keep only last 100 slow requests
-            self.slow_requests = self.slow_requests[-100:]
     
     def get_performance_report(self) -> Dict[str, Any]:
         """Get performance analysis report"""
         return {
-            'slow_queries': self.slow_queries[-10:],  # Last 10 slow queries
-            'slow_requests': self.slow_requests[-10:],  # Last 10 slow requests
+            'slow_queries': list(self.slow_queries)[-10:],  # Last 10 slow queries
+            'slow_requests': list(self.slow_requests)[-10:],  # Last 10 slow requests
             'query_count': len(self.slow_queries),
             'request_count': len(self.slow_requests)
         }
@@ -267,15 +344,8 @@ def setup_monitoring(app: Flask):
     @app.route('/metrics')
     @app.route('/api/metrics')
     def metrics():
-        """Prometheus-style metrics endpoint"""
-        metrics_data = monitor.get_metrics_summary()
-        
-        # Format as Prometheus metrics
-        prometheus_format = []
-        for key, value in metrics_data.items():
-            prometheus_format.append(f"diet_planner_{key} {value}")
-        
-        return '\n'.join(prometheus_format), 200, {'Content-Type': 'text/plain'}
+        """Prometheus metrics endpoint"""
+        return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
     
     @app.route('/performance')
     @app.route('/api/performance')
@@ -5,9 +5,11 @@ Implements enterprise-level security measures
 
 import os
 import re
+import threading
 import time
-from functools import wraps
-from typing import Dict, List, Optional
+from collections import defaultdict, deque
+from functools import lru_cache, wraps
+from typing import Deque, Dict, Optional, Union
 
 from flask import Flask, request, jsonify, current_app
 from flask_limiter import Limiter
@@ -17,14 +19,97 @@ import secrets
 import hashlib
 import hmac
 
+try:
+    import hyperscan
+except ImportError:  # hyperscan only ships x86-64 wheels; fall back to re
+    hyperscan = None
+
+
+# Suspicious input patterns, combined into one case-insensitive regex
+_SUSPICIOUS_PATTERNS = [
+    r'<script.*?>.*?</script>',  # XSS
+    r'javascript:',  # XSS
+    r'on\w+\s*=',  # Event handlers
+    r'union\s+select',  # SQL injection
+    r'drop\s+table',  # SQL injection
+    r'\.\./\.\.',  # Directory traversal
+]
+_SUSPICIOUS_INPUT_RE = re.compile(
+    '|'.join(f'(?:{pattern})' for pattern in _SUSPICIOUS_PATTERNS), re.IGNORECASE
+)
+
+
+def _compile_suspicious_database():
+    """Compile the patterns into one Hyperscan database (None without hyperscan)"""
+    if hyperscan is None:
+        return None
+    flags = (
+        hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+        | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+    )
+    database = hyperscan.Database()
+    database.compile(
+        expressions=[pattern.encode() for pattern in _SUSPICIOUS_PATTERNS],
+        ids=list(range(len(_SUSPICIOUS_PATTERNS))),
+        elements=len(_SUSPICIOUS_PATTERNS),
+        flags=[flags] * len(_SUSPICIOUS_PATTERNS),
+    )
+    return database
+
+
+_SUSPICIOUS_INPUT_DB = _compile_suspicious_database()
+# Hyperscan scratch space can't be shared between concurrent scans
+_scan_state = threading.local()
+
+
+def _stop_scan(*_):
+    return True  # The first match is enough
+
+
+def contains_suspicious_input(data_str: str) -> bool:
+    """Scan for any suspicious pattern in a single pass"""
+    if _SUSPICIOUS_INPUT_DB is None:
+        return _SUSPICIOUS_INPUT_RE.search(data_str) is not None
+    
+    scratch = getattr(_scan_state, 'scratch', None)
+    if scratch is None:
+        scratch = _scan_state.scratch = hyperscan.Scratch(_SUSPICIOUS_INPUT_DB)
+    try:
+        _SUSPICIOUS_INPUT_DB.scan(
+            data_str.encode('utf-8', 'replace'), match_event_handler=_stop_scan, scratch=scratch
+        )
+    except hyperscan.ScanTerminated:
+        return True
+    return False
+
+@lru_cache(maxsize=32)
+def _hmac_template(secret: str) -> hmac.HMAC:
+    """Keyed HMAC for a signing secret, copied for each signature check.
+
+    Bounded so callers passing many distinct secrets can't grow it without limit.
+    """
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+
+# API keys are random and high-entropy, so a keyed hash is enough - no slow KDF needed.
+# There's no default pepper: one that ships with the code doesn't protect the stored hash
+_API_KEY_PEPPER = (os.getenv('API_KEY_PEPPER') or os.getenv('API_KEY_SALT') or '').encode()
+_STORED_API_KEY_HASH = os.getenv('API_KEY_HASH')
+
 
 class SecurityManager:
     """Centralized security management"""
     
+    LOGIN_WINDOW = 900  # 15 minutes
+    SWEEP_INTERVAL = 1000  # login checks between sweeps of stale entries
+    MAX_JSON_INPUT_LENGTH = 10000  # 10KB limit
+    
     def __init__(self, app: Optional[Flask] = None):
         self.app = app
-        self.failed_login_attempts: Dict[str, List[float]] = {}
+        # Only the last 10 attempts per email matter - enough to trigger the IP block
+        self.failed_login_attempts: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=10))
         self.blocked_ips: Dict[str, float] = {}
+        self._checks_until_sweep = self.SWEEP_INTERVAL
         
         if app:
             self.init_app(app)
@@ -33,6 +118,11 @@ class SecurityManager:
         """Initialize security for Flask app"""
         self.app = app
         
+        if _STORED_API_KEY_HASH and not _API_KEY_PEPPER:
+            app.logger.error(
+                "API_KEY_HASH is set without API_KEY_PEPPER; API key authentication is disabled"
+            )
+        
         # Rate limiting
         self.limiter = Limiter(
             key_func=get_remote_address,
@@ -51,6 +141,11 @@ class SecurityManager:
     
     def setup_security_headers(self, app: Flask):
         """Configure security headers using Talisman"""
+        self.talisman = None
+        # Test clients don't need CSP/HSTS headers or a nonce per response
+        if app.config.get('TESTING'):
+            return
+        
         csp = {
             'default-src': "'self'",
             'script-src': "'self' 'unsafe-inline' https://apis.google.com",
@@ -66,7 +161,7 @@ class SecurityManager:
         # Only enforce HTTPS in production
         force_https = os.getenv('FLASK_ENV') == 'production'
         
-        Talisman(
+        self.talisman = Talisman(
             app,
             force_https=force_https,
             strict_transport_security=True,
@@ -85,10 +180,22 @@ class SecurityManager:
         
         @app.before_request
         def validate_input():
-            if request.is_json and request.get_json():
-                data = request.get_json()
-                if not self.validate_json_input(data):
-                    return jsonify({"error": "Invalid input data"}), 400
+            # Bodies on GET/HEAD/OPTIONS are ignored, so don't parse them
+            if request.method in ('GET', 'HEAD', 'OPTIONS') or not request.is_json:
+                return
+            
+            # Reject oversized bodies before parsing anything
+            body_length = request.content_length
+            if body_length is None:
+                # No Content-Length (e.g. chunked) - measure the buffered body instead
+                body_length = len(request.get_data(cache=True))
+            if body_length > self.MAX_JSON_INPUT_LENGTH:
+                return jsonify({"error": "Payload too large"}), 413
+            
+            # get_json caches the parsed body, so the view doesn't parse it again
+            data = request.get_json()
+            if data and not self.validate_json_input(data):
+                return jsonify({"error": "Invalid input data"}), 400
     
     def setup_csrf_protection(self, app: Flask):
         """Setup CSRF protection for state-changing operations"""
@@ -107,7 +214,7 @@ class SecurityManager:
                 csrf_token = request.headers.get('X-CSRF-Token')
                 session_token = request.cookies.get('csrf_token')
                 
-                if not csrf_token or not session_token or csrf_token != session_token:
+                if not csrf_token or not session_token or not constant_time_compare(csrf_token, session_token):
                     return jsonify({"error": "CSRF token missing or invalid"}), 403
     
     def validate_json_input(self, data: dict) -> bool:
@@ -115,25 +222,10 @@ class SecurityManager:
         if not isinstance(data, dict):
             return False
         
-        # Check for excessively large payloads
-        if len(str(data)) > 10000:  # 10KB limit
+        # Check for suspicious patterns (payload size is checked on the raw body by the hook)
+        if contains_suspicious_input(str(data)):
             return False
         
-        # Check for suspicious patterns
-        suspicious_patterns = [
-            r'<script.*?>.*?</script>',  # XSS
-            r'javascript:',  # XSS
-            r'on\w+\s*=',  # Event handlers
-            r'union\s+select',  # SQL injection
-            r'drop\s+table',  # SQL injection
-            r'\.\./\.\.',  # Directory traversal
-        ]
-        
-        data_str = str(data).lower()
-        for pattern in suspicious_patterns:
-            if re.search(pattern, data_str, re.IGNORECASE):
-                return False
-        
         return True
     
     def rate_limit_login_attempts(self, email: str, ip: str) -> bool:
@@ -141,20 +233,29 @@ class SecurityManager:
         current_time = time.time()
         
         # Clean old attempts (older than 15 minutes)
-        cutoff_time = current_time - 900
+        cutoff_time = current_time - self.LOGIN_WINDOW
+        
+        self._checks_until_sweep -= 1
+        if self._checks_until_sweep <= 0:
+            self._sweep_expired(current_time)
         
         # Check email-based rate limiting
-        if email in self.failed_login_attempts:
-            self.failed_login_attempts[email] = [
-                t for t in self.failed_login_attempts[email] if t > cutoff_time
-            ]
+        attempts = self.failed_login_attempts.get(email)
+        if attempts is not None:
+            while attempts and attempts[0] <= cutoff_time:
+                attempts.popleft()
             
-            if len(self.failed_login_attempts[email]) >= 5:
+            if not attempts:
+                self.failed_login_attempts.pop(email, None)
+            elif len(attempts) >= 5:
                 return False
         
         # Check IP-based rate limiting
-        if ip in self.blocked_ips and self.blocked_ips[ip] > current_time:
-            return False
+        blocked_until = self.blocked_ips.get(ip)
+        if blocked_until is not None:
+            if blocked_until > current_time:
+                return False
+            del self.blocked_ips[ip]
         
         return True
     
@@ -163,33 +264,53 @@ class SecurityManager:
         current_time = time.time()
         
         # Record failed attempt for email
-        if email not in self.failed_login_attempts:
-            self.failed_login_attempts[email] = []
-        self.failed_login_attempts[email].append(current_time)
+        attempts = self.failed_login_attempts[email]
+        attempts.append(current_time)
         
         # Block IP for 15 minutes after 10 failed attempts
-        email_attempts = len(self.failed_login_attempts[email])
-        if email_attempts >= 10:
-            self.blocked_ips[ip] = current_time + 900  # 15 minutes
+        if len(attempts) >= 10:
+            self.blocked_ips[ip] = current_time + self.LOGIN_WINDOW
+    
+    def _sweep_expired(self, current_time: float):
+        """Drop emails with no recent attempts and IP blocks that have run out"""
+        cutoff_time = current_time - self.LOGIN_WINDOW
+        # Snapshot the items: other request threads add keys while we sweep
+        stale_emails = [
+            email for email, attempts in list(self.failed_login_attempts.items())
+            if not attempts or attempts[-1] <= cutoff_time
+        ]
+        for email in stale_emails:
+            self.failed_login_attempts.pop(email, None)
+        
+        expired_ips = [ip for ip, blocked_until in list(self.blocked_ips.items()) if blocked_until <= current_time]
+        for ip in expired_ips:
+            self.blocked_ips.pop(ip, None)
+        self._checks_until_sweep = self.SWEEP_INTERVAL
     
     def generate_secure_token(self, length: int = 32) -> str:
         """Generate a cryptographically secure random token"""
         return secrets.token_urlsafe(length)
     
-    def hash_api_key(self, api_key: str) -> str:
-        """Hash an API key for secure storage"""
-        salt = os.getenv('API_KEY_SALT', 'default_salt').encode()
-        return hashlib.pbkdf2_hex(api_key.encode(), salt, 100000, 32)
+    @staticmethod
+    def hash_api_key(api_key: str) -> str:
+        """Hash an API key for secure storage (HMAC-SHA256 keyed with the server-side pepper)"""
+        return hmac.new(_API_KEY_PEPPER, api_key.encode(), hashlib.sha256).hexdigest()
     
-    def verify_signature(self, payload: str, signature: str, secret: str) -> bool:
+    def verify_signature(self, payload: Union[str, bytes], signature: str, secret: str) -> bool:
         """Verify HMAC signature for webhook/API validation"""
-        expected_signature = hmac.new(
-            secret.encode(),
-            payload.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        mac = _hmac_template(secret).copy()
+        mac.update(payload if isinstance(payload, bytes) else payload.encode())
+        try:
+            signature_bytes = bytes.fromhex(signature)
+        except ValueError:
+            return False
         
-        return hmac.compare_digest(signature, expected_signature)
+        return hmac.compare_digest(mac.digest(), signature_bytes)
+
+
+def constant_time_compare(a: str, b: str) -> bool:
+    """Compare two secrets without leaking where they differ through timing"""
+    return hmac.compare_digest(a.encode(), b.encode())
 
 
 def require_api_key(f):
@@ -212,12 +333,10 @@ def verify_api_key(api_key: str) -> bool:
     """Verify API key against stored hash"""
     # Implementation depends on where you store API keys
     # This is a placeholder - implement according to your needs
-    stored_hash = os.getenv('API_KEY_HASH')
-    if not stored_hash:
+    if not _STORED_API_KEY_HASH or not _API_KEY_PEPPER:
         return False
     
-    security_manager = SecurityManager()
-    return security_manager.hash_api_key(api_key) == stored_hash
+    return constant_time_compare(SecurityManager.hash_api_key(api_key), _STORED_API_KEY_HASH)
 
 
 def require_admin(f):
@@ -1,12 +1,15 @@
 """
 Unit tests for API endpoints.
 """
+import copy
 import json
+from datetime import timedelta
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from app import app
+from app import DietPlanJob, app
+from conftest import make_diet_plans
 
 
 @pytest.mark.unit
@@ -196,7 +199,7 @@ class TestDietPlanEndpoints:
         self, mock_gemini, client, auth_headers, mock_gemini_response
     ):
         """Test generating diet plan with valid authentication."""
-        mock_gemini.return_value = mock_gemini_response
+        mock_gemini.return_value = copy.deepcopy(dict(mock_gemini_response))
 
         response = client.post("/api/diet-plan", headers=auth_headers)
 
@@ -223,6 +226,127 @@ class TestDietPlanEndpoints:
         data = json.loads(response.data)
         assert "error" in data
 
+    @patch("app.generate_diet_plan_with_gemini")
+    @patch("app.diet_plan_executor.submit")
+    def test_queue_diet_plan_job(
+        self, mock_submit, mock_gemini, client, auth_headers, mock_gemini_response
+    ):
+        """Test queueing a diet plan and polling the job until it completes."""
+        mock_gemini.return_value = copy.deepcopy(dict(mock_gemini_response))
+
+        response = client.post("/api/diet-plan/jobs", headers=auth_headers)
+
+        assert response.status_code == 202
+        job = json.loads(response.data)
+        assert job["status"] == "pending"
+        assert job["diet_plan"] is None
+
+        # Run the queued work inline instead of on the executor
+        fn, *args = mock_submit.call_args.args
+        fn(*args)
+
+        response = client.get(f"/api/diet-plan/jobs/{job['id']}", headers=auth_headers)
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["status"] == "completed"
+        assert "plan_data" in data["diet_plan"]
+
+    @patch("app.generate_diet_plan_with_gemini")
+    @patch("app.diet_plan_executor.submit")
+    def test_queue_diet_plan_job_worker_error(self, mock_submit, mock_gemini, client, auth_headers):
+        """Test that a job whose generation raises is reported as failed."""
+        mock_gemini.side_effect = RuntimeError("Gemini unavailable")
+
+        job = client.post("/api/diet-plan/jobs", headers=auth_headers).get_json()
+        fn, *args = mock_submit.call_args.args
+        fn(*args)
+
+        response = client.get(f"/api/diet-plan/jobs/{job['id']}", headers=auth_headers)
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["status"] == "failed"
+        assert data["error"] == "Internal server error"
+        assert data["diet_plan"] is None
+
+    @patch("app.diet_plan_executor.submit")
+    def test_stale_diet_plan_job_reported_failed(self, mock_submit, client, auth_headers, db_session):
+        """Test that a job left pending past the timeout (its worker died) is failed on poll."""
+        job = client.post("/api/diet-plan/jobs", headers=auth_headers).get_json()
+        stored = db_session.get(DietPlanJob, job["id"])
+        stored.created_at -= timedelta(seconds=app.config["DIET_PLAN_JOB_TIMEOUT"] + 1)
+        db_session.commit()
+
+        response = client.get(f"/api/diet-plan/jobs/{job['id']}", headers=auth_headers)
+
+        data = json.loads(response.data)
+        assert data["status"] == "failed"
+        assert data["error"] == "Diet plan generation timed out"
+
+        # A worker that finishes afterwards leaves the job failed
+        fn, *args = mock_submit.call_args.args
+        fn(*args)
+        db_session.expire_all()
+        assert db_session.get(DietPlanJob, job["id"]).status == "failed"
+
+    @patch("app.generate_diet_plan_with_gemini")
+    @patch("app.diet_plan_executor.submit")
+    def test_diet_plan_job_timed_out_while_running(
+        self, mock_submit, mock_gemini, client, auth_headers, db_session, mock_gemini_response
+    ):
+        """Test that a plan finishing after its job timed out doesn't overwrite the failure."""
+        job = client.post("/api/diet-plan/jobs", headers=auth_headers).get_json()
+        timeout = app.config["DIET_PLAN_JOB_TIMEOUT"]
+
+        def generate_past_timeout(user_data):
+            # Queue time doesn't count: a job created long ago but just started is fine
+            stored = db_session.get(DietPlanJob, job["id"])
+            stored.created_at -= timedelta(seconds=timeout + 1)
+            db_session.commit()
+            poll = client.get(f"/api/diet-plan/jobs/{job['id']}", headers=auth_headers).get_json()
+            assert poll["status"] == "running"
+
+            # Generation outlives the timeout and a poll gives up on the job
+            stored.started_at -= timedelta(seconds=timeout + 1)
+            db_session.commit()
+            poll = client.get(f"/api/diet-plan/jobs/{job['id']}", headers=auth_headers).get_json()
+            assert poll["status"] == "failed"
+            return copy.deepcopy(dict(mock_gemini_response))
+
+        mock_gemini.side_effect = generate_past_timeout
+        fn, *args = mock_submit.call_args.args
+        fn(*args)
+
+        db_session.expire_all()
+        stored = db_session.get(DietPlanJob, job["id"])
+        assert stored.status == "failed"
+        assert stored.error == "Diet plan generation timed out"
+        assert stored.diet_plan_id is None
+
+    @pytest.mark.parametrize("route", ["/api/diet-plan", "/api/diet-plan/jobs"])
+    @patch("app.diet_plan_executor.submit")
+    @patch("app.generate_diet_plan_with_gemini")
+    def test_diet_plan_unknown_activity_level(
+        self, mock_gemini, mock_submit, route, client, auth_headers, sample_user, db_session
+    ):
+        """Test that a stored activity level outside ActivityLevel is a 400, not a 500."""
+        sample_user.activity_level = "extreme"
+        db_session.commit()
+
+        response = client.post(route, headers=auth_headers)
+
+        assert response.status_code == 400
+        assert "Activity Level must be one of" in json.loads(response.data)["error"]
+        mock_gemini.assert_not_called()
+        mock_submit.assert_not_called()
+
+    def test_get_diet_plan_job_not_found(self, client, auth_headers):
+        """Test polling a job that doesn't exist."""
+        response = client.get("/api/diet-plan/jobs/missing", headers=auth_headers)
+
+        assert response.status_code == 404
+
     def test_get_user_diet_plans_authenticated(self, client, auth_headers, sample_diet_plan):
         """Test getting user's diet plans with authentication."""
         response = client.get("/api/diet-plans", headers=auth_headers)
@@ -230,6 +354,22 @@ class TestDietPlanEndpoints:
         assert response.status_code == 200
         data = json.loads(response.data)
         assert isinstance(data, list)
+        assert all("plan_data" not in plan for plan in data)
+
+    def test_get_user_diet_plans_single_query(
+        self, client, auth_headers, sample_user, db_session, count_queries
+    ):
+        """Test that listing plans runs one SELECT however many plans there are."""
+        make_diet_plans(3, db_session, user=sample_user)
+        db_session.expire_all()
+
+        with count_queries() as statements:
+            response = client.get("/api/diet-plans", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert len(response.get_json()) == 3
+        selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+        assert len(selects) == 1
 
     def test_get_user_diet_plans_unauthenticated(self, client):
         """Test getting diet plans without authentication."""
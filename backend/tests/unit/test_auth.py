@@ -3,224 +3,163 @@ Unit tests for authentication functionality.
 """
 from unittest.mock import patch
 
+import bcrypt
 import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from app import hash_password, pwd_ctx, validate_user_data
+from conftest import UserPayload
+
+pytestmark = [pytest.mark.unit, pytest.mark.auth]
+
+
+# User data validation
+def test_valid_user_data():
+    """Test validation with valid user data."""
+    valid_data = UserPayload(
+        weight=75.5,
+        height=180,
+        activity_level="moderate",
+        diet_preference="balanced",
+        health_goals="Weight loss",
+    ).as_dict()
+
+    result = validate_user_data(valid_data)
+    assert result is None  # No validation errors
+
+
+def test_missing_required_fields():
+    """Test validation with missing required fields."""
+    incomplete_data = {
+        "name": "John Doe",
+        # Missing email, password, age, gender, weight
+    }
+
+    result = validate_user_data(incomplete_data)
+    assert "Missing required field" in (result or "")
+
+
+@pytest.mark.parametrize("field,value,expected", [
+    ("name", "", "cannot be empty"),
+    ("email", "invalid-email", "valid email address"),
+    ("password", "123", "at least 6 characters"),
+    ("age", 0, "at least 1"),
+    ("age", 150, "at most 120"),
+    ("gender", "invalid", "must be one of"),
+    ("weight", 10, "at least 20"),
+    ("weight", 400, "at most 300"),
+], ids=["empty_name", "bad_email", "short_pw", "age_low", "age_high", "bad_gender", "weight_low", "weight_high"])
+def test_invalid_field(field, value, expected):
+    """Test validation rejects a single bad field on otherwise valid data."""
+    result = validate_user_data(UserPayload(**{field: value}).as_dict())
+    assert expected in (result or "")
 
-from app import validate_user_data
-
-
-@pytest.mark.unit
-@pytest.mark.auth
-class TestUserValidation:
-    """Test cases for user data validation."""
-
-    def test_valid_user_data(self):
-        """Test validation with valid user data."""
-        valid_data = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 30,
-            "gender": "male",
-            "weight": 75.5,
-            "height": 180,
-            "activity_level": "moderate",
-            "diet_preference": "balanced",
-            "health_goals": "Weight loss",
-        }
-
-        result = validate_user_data(valid_data)
-        assert result is None  # No validation errors
-
-    def test_missing_required_fields(self):
-        """Test validation with missing required fields."""
-        incomplete_data = {
-            "name": "John Doe",
-            # Missing email, password, age, gender, weight
-        }
-
-        result = validate_user_data(incomplete_data)
-        assert result is not None
-        assert "Missing required field" in result
-
-    def test_empty_string_values(self):
-        """Test validation with empty string values."""
-        data_with_empty_strings = {
-            "name": "",  # Empty name
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 30,
-            "gender": "male",
-            "weight": 75,
-        }
-
-        result = validate_user_data(data_with_empty_strings)
-        assert result is not None
-        assert "cannot be empty" in result
-
-    def test_invalid_email_format(self):
-        """Test validation with invalid email format."""
-        data_with_invalid_email = {
-            "name": "John Doe",
-            "email": "invalid-email",  # Invalid format
-            "password": "password123",
-            "age": 30,
-            "gender": "male",
-            "weight": 75,
-        }
-
-        result = validate_user_data(data_with_invalid_email)
-        assert result is not None
-        assert "valid email address" in result
-
-    def test_password_too_short(self):
-        """Test validation with too short password."""
-        data_with_short_password = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "123",  # Too short
-            "age": 30,
-            "gender": "male",
-            "weight": 75,
-        }
-
-        result = validate_user_data(data_with_short_password)
-        assert result is not None
-        assert "at least 6 characters" in result
-
-    def test_invalid_age_range(self):
-        """Test validation with invalid age values."""
-        # Test too young
-        data_too_young = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 0,  # Too young
-            "gender": "male",
-            "weight": 75,
-        }
-
-        result = validate_user_data(data_too_young)
-        assert result is not None
-        assert "at least 1" in result
-
-        # Test too old
-        data_too_old = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 150,  # Too old
-            "gender": "male",
-            "weight": 75,
-        }
-
-        result = validate_user_data(data_too_old)
-        assert result is not None
-        assert "at most 120" in result
-
-    def test_invalid_gender(self):
-        """Test validation with invalid gender value."""
-        data_with_invalid_gender = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 30,
-            "gender": "invalid",  # Invalid gender
-            "weight": 75,
-        }
-
-        result = validate_user_data(data_with_invalid_gender)
-        assert result is not None
-        assert "must be one of" in result
-
-    def test_invalid_weight_range(self):
-        """Test validation with invalid weight values."""
-        # Test too light
-        data_too_light = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 30,
-            "gender": "male",
-            "weight": 10,  # Too light
-        }
-
-        result = validate_user_data(data_too_light)
-        assert result is not None
-        assert "at least 20" in result
-
-        # Test too heavy
-        data_too_heavy = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 30,
-            "gender": "male",
-            "weight": 400,  # Too heavy
-        }
-
-        result = validate_user_data(data_too_heavy)
-        assert result is not None
-        assert "at most 300" in result
-
-    def test_optional_fields_validation(self):
-        """Test validation of optional fields."""
-        data_with_optional_fields = {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "password": "password123",
-            "age": 30,
-            "gender": "male",
-            "weight": 75,
-            "height": 50,  # Too short
-            "activity_level": "invalid_level",  # Invalid activity level
-            "diet_preference": "invalid_diet",  # Invalid diet preference
-        }
-
-        result = validate_user_data(data_with_optional_fields)
-        assert result is not None
-        # Should catch validation errors for optional fields too
-
-    def test_update_validation_without_password(self):
-        """Test validation for updates where password is not required."""
-        update_data = {
-            "name": "John Updated",
-            "email": "john.updated@example.com",
-            "age": 31,
-            "gender": "male",
-            "weight": 76
-            # No password field
-        }
-
-        result = validate_user_data(update_data, is_update=True)
-        assert result is None  # Should pass validation for updates
-
-
-@pytest.mark.unit
-@pytest.mark.auth
-class TestPasswordHashing:
-    """Test cases for password hashing functionality."""
-
-    def test_password_hashing_consistency(self, sample_user):
-        """Test that password hashing is consistent."""
-        password = "testpassword123"
-
-        # Set password
-        sample_user.set_password(password)
-        hash1 = sample_user.password_hash
-
-        # Set same password again
-        sample_user.set_password(password)
-        hash2 = sample_user.password_hash
-
-        # Hashes should be different (due to salt) but both should verify
-        assert hash1 != hash2
-        assert sample_user.check_password(password)
-
-    def test_password_verification_case_sensitive(self, sample_user):
-        """Test that password verification is case sensitive."""
-        password = "TestPassword123"
-        sample_user.set_password(password)
-
-        assert sample_user.check_password("TestPassword123") is True
-        assert sample_user.check_password("testpassword123") is False
-        assert sample_user.check_password("TESTPASSWORD123") is False
+
+@given(
+    age=st.integers(1, 120),
+    weight=st.floats(20, 300),
+    gender=st.sampled_from(["male", "female", "other", "Male", "FEMALE"]),
+)
+def test_in_range_values_accepted(age, weight, gender):
+    """Test validation accepts any age, weight and gender inside the allowed ranges."""
+    assert validate_user_data(UserPayload(age=age, weight=weight, gender=gender).as_dict()) is None
+
+
+@given(age=st.integers().filter(lambda a: a < 1 or a > 120))
+def test_out_of_range_age_rejected(age):
+    """Test validation rejects every age outside 1-120."""
+    result = validate_user_data(UserPayload(age=age).as_dict())
+    assert (result or "").startswith("Age must be at")
+
+
+@given(weight=st.floats(allow_nan=False).filter(lambda w: w < 20 or w > 300))
+def test_out_of_range_weight_rejected(weight):
+    """Test validation rejects every weight outside 20-300."""
+    result = validate_user_data(UserPayload(weight=weight).as_dict())
+    assert (result or "").startswith("Weight must be at")
+
+
+def test_optional_fields_validation():
+    """Test validation of optional fields."""
+    data_with_optional_fields = UserPayload(
+        height=50,  # Too short
+        activity_level="invalid_level",  # Invalid activity level
+        diet_preference="invalid_diet",  # Invalid diet preference
+    ).as_dict()
+
+    result = validate_user_data(data_with_optional_fields)
+    assert result is not None
+    # Should catch validation errors for optional fields too
+
+
+def test_update_validation_without_password():
+    """Test validation for updates where password is not required."""
+    update_data = {
+        "name": "John Updated",
+        "email": "john.updated@example.com",
+        "age": 31,
+        "gender": "male",
+        "weight": 76
+        # No password field
+    }
+
+    result = validate_user_data(update_data, is_update=True)
+    assert result is None  # Should pass validation for updates
+
+
+# Password hashing
+def test_password_hashing_consistency(unsaved_user):
+    """Test that password hashing is consistent."""
+    password = "testpassword123"
+
+    # Set password
+    unsaved_user.set_password(password)
+    hash1 = unsaved_user.password_hash
+
+    # Set same password again
+    unsaved_user.set_password(password)
+    hash2 = unsaved_user.password_hash
+
+    # Hashes should be different (due to salt) but both should verify
+    assert hash1 != hash2
+    assert unsaved_user.check_password(password)
+
+
+@pytest.fixture(scope="module")
+def case_sensitive_hash():
+    """Hash of "TestPassword123", computed once for the case-sensitivity cases."""
+    return hash_password("TestPassword123", rounds=4)
+
+
+@pytest.mark.parametrize("candidate,expected", [
+    ("TestPassword123", True),
+    ("testpassword123", False),
+    ("TESTPASSWORD123", False),
+], ids=["exact", "lowercase", "uppercase"])
+def test_password_verification_case_sensitive(unsaved_user, case_sensitive_hash, candidate, expected):
+    """Test that password verification is case sensitive."""
+    unsaved_user.password_hash = case_sensitive_hash
+
+    assert unsaved_user.check_password(candidate) is expected
+
+
+def test_password_longer_than_72_bytes_not_truncated(unsaved_user):
+    """Test that passwords sharing a 72-byte prefix don't verify each other."""
+    prefix = "x" * 72
+    unsaved_user.set_password(prefix + "a")
+
+    assert unsaved_user.check_password(prefix + "a") is True
+    assert unsaved_user.check_password(prefix + "b") is False
+
+
+def test_legacy_hash_upgraded_on_check(unsaved_user):
+    """Test that a raw-bcrypt hash still verifies and is re-hashed on success."""
+    unsaved_user.password_hash = bcrypt.hashpw(b"legacypass", bcrypt.gensalt(rounds=4)).decode("utf-8")
+
+    assert unsaved_user.check_password("wrongpass") is False
+    assert pwd_ctx.identify(unsaved_user.password_hash) == "bcrypt"
+
+    assert unsaved_user.check_password("legacypass") is True
+    assert pwd_ctx.identify(unsaved_user.password_hash) == "bcrypt_sha256"
+    assert unsaved_user.check_password("legacypass") is True
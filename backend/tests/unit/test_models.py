@@ -13,7 +13,7 @@ from app import DietPlan, User
 class TestUserModel:
     """Test cases for User model."""
 
-    def test_user_creation(self, db_session):
+    def test_user_creation(self, db_session, precomputed_hash):
         """Test creating a user with valid data."""
         user = User(
             name="John Doe",
@@ -26,7 +26,7 @@ class TestUserModel:
             diet_preference="balanced",
             health_goals="Weight loss",
         )
-        user.set_password("password123")
+        user.password_hash = precomputed_hash
 
         db_session.add(user)
         db_session.commit()
@@ -64,7 +64,7 @@ class TestUserModel:
         assert user.check_password("mypassword") is True
         assert user.check_password("wrongpassword") is False
 
-    def test_user_email_uniqueness(self, db_session, sample_user):
+    def test_user_email_uniqueness(self, db_session, sample_user, precomputed_hash):
         """Test that email addresses must be unique."""
         with pytest.raises(Exception):  # Should raise IntegrityError
             duplicate_user = User(
@@ -74,14 +74,14 @@ class TestUserModel:
                 gender="female",
                 weight=60,
             )
-            duplicate_user.set_password("password")
+            duplicate_user.password_hash = precomputed_hash
             db_session.add(duplicate_user)
             db_session.commit()
 
-    def test_user_repr(self, db_session):
+    def test_user_repr(self, db_session, precomputed_hash):
         """Test user string representation."""
         user = User(name="Test User", email="test@example.com", age=30, gender="male", weight=70)
-        user.set_password("password123")  # Set password since it's required
+        user.password_hash = precomputed_hash  # Set password since it's required
         db_session.add(user)
         db_session.commit()
 
@@ -0,0 +1,211 @@
+"""
+Unit tests for the security manager.
+"""
+import hashlib
+import hmac
+import io
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+import security
+from app import security_manager
+from security import SecurityManager, contains_suspicious_input, verify_api_key
+
+pytestmark = [pytest.mark.unit, pytest.mark.auth]
+
+IP = "203.0.113.7"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace time.time in the security module with a clock the test moves by hand."""
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(security.time, "time", lambda: now.value)
+    return now
+
+
+@pytest.fixture
+def manager():
+    """A security manager with empty login state, not attached to an app."""
+    return SecurityManager()
+
+
+# Login rate limiting
+def test_email_blocked_after_five_failures(manager, clock):
+    """Test that an email is locked out after 5 failures and let back in after the window."""
+    for _ in range(4):
+        manager.record_failed_login("user@example.com", IP)
+    assert manager.rate_limit_login_attempts("user@example.com", IP)
+
+    manager.record_failed_login("user@example.com", IP)
+    assert not manager.rate_limit_login_attempts("user@example.com", IP)
+    # Only that email is locked out; the IP isn't blocked yet
+    assert manager.rate_limit_login_attempts("other@example.com", IP)
+
+    clock.value += SecurityManager.LOGIN_WINDOW + 1
+    assert manager.rate_limit_login_attempts("user@example.com", IP)
+    assert "user@example.com" not in manager.failed_login_attempts
+
+
+def test_ip_blocked_after_ten_failures_until_expiry(manager, clock):
+    """Test that 10 failures block the IP for every email until the block runs out."""
+    for _ in range(10):
+        manager.record_failed_login("user@example.com", IP)
+    assert manager.blocked_ips[IP] == clock.value + SecurityManager.LOGIN_WINDOW
+
+    assert not manager.rate_limit_login_attempts("other@example.com", IP)
+    assert manager.rate_limit_login_attempts("other@example.com", "198.51.100.1")
+
+    clock.value += SecurityManager.LOGIN_WINDOW - 1
+    assert not manager.rate_limit_login_attempts("other@example.com", IP)
+
+    clock.value += 2
+    assert manager.rate_limit_login_attempts("other@example.com", IP)
+    assert IP not in manager.blocked_ips
+
+
+def test_sweep_removes_stale_entries(monkeypatch, clock):
+    """Test that every SWEEP_INTERVAL checks, expired emails and IP blocks are dropped."""
+    monkeypatch.setattr(SecurityManager, "SWEEP_INTERVAL", 3)
+    manager = SecurityManager()
+    for i in range(10):
+        manager.record_failed_login(f"user{i}@example.com", IP)
+    for _ in range(10):
+        manager.record_failed_login("blocker@example.com", "198.51.100.1")
+
+    clock.value += SecurityManager.LOGIN_WINDOW + 1
+    manager.record_failed_login("recent@example.com", IP)
+
+    # The first checks don't sweep, so entries nobody asked about are still there
+    manager.rate_limit_login_attempts("someone@example.com", "192.0.2.1")
+    manager.rate_limit_login_attempts("someone@example.com", "192.0.2.1")
+    assert "user0@example.com" in manager.failed_login_attempts
+    assert "198.51.100.1" in manager.blocked_ips
+
+    manager.rate_limit_login_attempts("someone@example.com", "192.0.2.1")
+    assert set(manager.failed_login_attempts) == {"recent@example.com"}
+    assert manager.blocked_ips == {}
+
+
+# API keys
+def test_verify_api_key_with_pepper(monkeypatch):
+    """Test that a key matching the stored hash is accepted when a pepper is configured."""
+    monkeypatch.setattr(security, "_API_KEY_PEPPER", b"test-pepper")
+    monkeypatch.setattr(security, "_STORED_API_KEY_HASH", SecurityManager.hash_api_key("key-123"))
+
+    assert verify_api_key("key-123")
+    assert not verify_api_key("key-456")
+
+
+def test_verify_api_key_without_pepper(monkeypatch):
+    """Test that no key is accepted while the pepper is unset, even one matching the hash."""
+    monkeypatch.setattr(security, "_API_KEY_PEPPER", b"")
+    monkeypatch.setattr(security, "_STORED_API_KEY_HASH", SecurityManager.hash_api_key("key-123"))
+
+    assert not verify_api_key("key-123")
+
+
+# Signatures
+def test_verify_signature(manager):
+    """Test that only the payload's own hex HMAC-SHA256 is accepted."""
+    signature = hmac.new(b"webhook-secret", b'{"event": "ping"}', hashlib.sha256).hexdigest()
+
+    assert manager.verify_signature('{"event": "ping"}', signature, "webhook-secret")
+    assert manager.verify_signature(b'{"event": "ping"}', signature, "webhook-secret")
+    assert not manager.verify_signature('{"event": "pong"}', signature, "webhook-secret")
+    assert not manager.verify_signature('{"event": "ping"}', signature, "other-secret")
+    assert not manager.verify_signature('{"event": "ping"}', "not hex", "webhook-secret")
+
+
+def test_hmac_templates_bounded(manager):
+    """Test that keyed HMACs are cached for a bounded number of secrets."""
+    security._hmac_template.cache_clear()
+    for i in range(100):
+        manager.verify_signature("payload", "00", f"secret-{i}")
+
+    info = security._hmac_template.cache_info()
+    assert info.currsize == info.maxsize < 100
+
+
+# Suspicious input scanning
+SUSPICIOUS_INPUT_CASES = [
+    ("<script>alert(1)</script>", True),
+    ("<SCRIPT src=x>steal()</Script>", True),
+    ("javascript:void(0)", True),
+    ('<img src=x onerror = "alert(1)">', True),
+    ("1 UNION   SELECT password FROM users", True),
+    ("x'; drop table users; --", True),
+    ("../../etc/passwd", True),
+    ("Café au lait, then <script>x</script>", True),
+    ("Weight loss and more energy", False),
+    ("I like onions", False),
+    ("Crème brûlée on Sundays", False),
+    ("../notes.txt", False),
+    ("", False),
+]
+
+
+@pytest.fixture(params=["hyperscan", "re"])
+def scan_engine(request, monkeypatch):
+    """Run the scan through Hyperscan, or force the re fallback."""
+    if request.param == "hyperscan":
+        if security._SUSPICIOUS_INPUT_DB is None:
+            pytest.skip("hyperscan is not installed")
+    else:
+        monkeypatch.setattr(security, "_SUSPICIOUS_INPUT_DB", None)
+    return request.param
+
+
+@pytest.mark.parametrize("text,expected", SUSPICIOUS_INPUT_CASES)
+def test_contains_suspicious_input(scan_engine, text, expected):
+    """Test that Hyperscan and the re fallback flag the same inputs."""
+    assert contains_suspicious_input(text) is expected
+
+
+# Request body checks
+def _oversized_body():
+    return json.dumps({"name": "x" * SecurityManager.MAX_JSON_INPUT_LENGTH}).encode()
+
+
+def test_oversized_body_rejected(client):
+    """Test that a JSON body over 10KB gets a 413 before it's parsed."""
+    with patch.object(security_manager, "validate_json_input") as validate:
+        response = client.post(
+            "/api/register", data=_oversized_body(), content_type="application/json"
+        )
+
+    assert response.status_code == 413
+    assert response.get_json()["error"] == "Payload too large"
+    validate.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "body,expected_status", [(_oversized_body(), 413), (b"{}", 400)], ids=["oversized", "small"]
+)
+def test_chunked_body_measured_from_raw_bytes(client, body, expected_status):
+    """Test that a body without Content-Length is sized by reading it, not waved through."""
+    # A chunked request has no Content-Length; the server marks the stream as terminated
+    response = client.post(
+        "/api/register",
+        input_stream=io.BytesIO(body),
+        content_type="application/json",
+        headers={"Transfer-Encoding": "chunked"},
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+
+    assert response.status_code == expected_status
+    if expected_status == 400:
+        # The body was read and parsed, so validation saw the empty object
+        assert "Missing required field" in response.get_json()["error"]
+
+
+def test_get_json_body_not_parsed(client):
+    """Test that a JSON body on a GET is ignored rather than parsed and validated."""
+    with patch.object(security_manager, "validate_json_input") as validate:
+        response = client.get("/api/health", data="{not json", content_type="application/json")
+
+    assert response.status_code != 400
+    validate.assert_not_called()
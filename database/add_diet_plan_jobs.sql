@@ -0,0 +1,27 @@
+-- Migration to add queued diet plan generation
+-- Run this script to update existing database schema
+
+-- POST /api/diet-plan/jobs records a row here and returns its id;
+-- GET /api/diet-plan/jobs/<id> reports the status and the finished plan
+CREATE TABLE IF NOT EXISTS diet_plan_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, running, completed, failed
+    diet_plan_id INTEGER REFERENCES diet_plans(id) ON DELETE SET NULL,
+    error VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP, -- set when a worker picks the job up
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Databases that ran an earlier version of this script lack started_at
+ALTER TABLE diet_plan_jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMP;
+
+-- Verify the migration
+SELECT 
+    column_name, 
+    data_type, 
+    is_nullable 
+FROM information_schema.columns 
+WHERE table_name = 'diet_plan_jobs' 
+ORDER BY ordinal_position;
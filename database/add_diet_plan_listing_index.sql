@@ -0,0 +1,17 @@
+-- Migration to index the per-user diet plan listing
+-- Run this script to update existing database schema
+
+-- /api/diet-plans filters by user_id and orders by created_at DESC;
+-- this lets PostgreSQL read plans in index order instead of sorting them
+CREATE INDEX IF NOT EXISTS idx_diet_plans_user_created ON diet_plans(user_id, created_at DESC);
+
+-- Meal logs are looked up per user and date (already in init.sql for new databases)
+CREATE INDEX IF NOT EXISTS idx_meal_logs_user_date ON meal_logs(user_id, meal_date);
+
+-- Verify the migration
+SELECT 
+    indexname, 
+    indexdef 
+FROM pg_indexes 
+WHERE tablename IN ('diet_plans', 'meal_logs') 
+ORDER BY indexname;
@@ -45,9 +45,22 @@ CREATE TABLE IF NOT EXISTS meal_logs (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create diet_plan_jobs table for queued diet plan generation
+CREATE TABLE IF NOT EXISTS diet_plan_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, running, completed, failed
+    diet_plan_id INTEGER REFERENCES diet_plans(id) ON DELETE SET NULL,
+    error VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP, -- set when a worker picks the job up
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_diet_plans_user_id ON diet_plans(user_id);
+CREATE INDEX IF NOT EXISTS idx_diet_plans_user_created ON diet_plans(user_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_diet_plans_dates ON diet_plans(start_date, end_date);
 CREATE INDEX IF NOT EXISTS idx_meal_logs_user_date ON meal_logs(user_id, meal_date);
 
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { User, DietPlan, UserFormData } from '../types';
+import { User, DietPlan, DietPlanJob, DietPlanSummary, UserFormData } from '../types';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5001/api';
 
@@ -63,8 +63,14 @@ export const updateProfile = (userData: Partial<UserFormData> & { password?: str
 export const generateDietPlan = () => 
   api.post<DietPlan>('/diet-plan');
 
+export const queueDietPlan = () => 
+  api.post<DietPlanJob>('/diet-plan/jobs');
+
+export const getDietPlanJob = (jobId: string) => 
+  api.get<DietPlanJob>(`/diet-plan/jobs/${jobId}`);
+
 export const getUserDietPlans = () => 
-  api.get<DietPlan[]>('/diet-plans');
+  api.get<DietPlanSummary[]>('/diet-plans');
 
 export const getDietPlan = (planId: number) => 
   api.get<DietPlan>(`/diet-plan/${planId}`);
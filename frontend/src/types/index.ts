@@ -55,6 +55,18 @@ export interface DietPlan {
   updated_at: string;
 }
 
+// Listing entries from /diet-plans omit the plan payload
+export type DietPlanSummary = Omit<DietPlan, 'plan_data'>;
+
+// Queued generation from /diet-plan/jobs; diet_plan is set once completed
+export interface DietPlanJob {
+  id: string;
+  status: 'pending' | 'completed' | 'failed';
+  error: string | null;
+  created_at: string;
+  diet_plan: DietPlan | null;
+}
+
 export interface UserFormData {
   name: string;
   email: string;